@@ -5089,6 +5089,38 @@ def device_v2(device_name):
   return device(device_name)
 
 
+class _DeviceProbe(object):
+  """Stands in for a new `Operation` when applying device functions."""
+
+  def __init__(self):
+    self.device = ""
+    self.type = ""
+    self.name = ""
+    self.node_def = node_def_pb2.NodeDef()
+
+  def _set_device(self, device):  # pylint: disable=redefined-outer-name
+    self.device = _device_string(device)
+
+  def _set_device_from_string(self, device_str):
+    self.device = device_str
+
+
+def current_device_name():
+  """Returns the device that the enclosing device scopes place new ops on.
+
+  When graph building, including while tracing a `tf.function`, the device
+  functions of the default graph are applied to a stand-in for a new op.
+
+  Returns:
+    A device string, which is empty if no device is set.
+  """
+  if context.executing_eagerly():
+    return context.context().device_name or ""
+  probe = _DeviceProbe()
+  get_default_graph()._apply_device_functions(probe)  # pylint: disable=protected-access
+  return probe.device or ""
+
+
 @tf_export(v1=["container"])
 def container(container_name):
   """Wrapper for `Graph.container()` using the default graph.
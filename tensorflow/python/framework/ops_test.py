@@ -1445,6 +1445,13 @@ class DeviceTest(test_util.TensorFlowTestCase):
         self.assertRegexpMatches(t.device, "/device:CPU:0")
         self.assertRegexpMatches(t.backing_device, "/device:CPU:0")
 
+  def testCurrentDeviceName(self):
+    g = ops.Graph()
+    with g.as_default():
+      self.assertEqual("", ops.current_device_name())
+      with g.device("/job:worker"), g.device("/device:GPU:1"):
+        self.assertEqual("/job:worker/device:GPU:1", ops.current_device_name())
+
   def testDevicePartialString(self):
     g = ops.Graph()
     with g.device("/job:worker/replica:2"):
@@ -18,6 +18,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
+
 import numpy as np
 
 from tensorflow.core.framework import attr_value_pb2
@@ -38,6 +40,7 @@ from tensorflow.python.ops import gen_functional_ops
 from tensorflow.python.ops import gradients_impl
 from tensorflow.python.ops import init_ops
 from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import random_ops
 from tensorflow.python.ops import resource_variable_ops
 from tensorflow.python.ops import variable_scope
 from tensorflow.python.ops import variables
@@ -58,6 +61,15 @@ def simple_scoped_fn(a, x):
     return math_ops.multiply(math_ops.add(a, x), two)
 
 
+# The scale applied by scaled_fold_fn.
+fold_scale = [1.0]
+
+
+def scaled_fold_fn(a, x):
+  """Simple function: (a, x) -> a + s * x, for the global scale s."""
+  return a + x * fold_scale[0]
+
+
 @test_util.with_control_flow_v2
 class FunctionalOpsTest(test.TestCase):
 
@@ -76,6 +88,92 @@ class FunctionalOpsTest(test.TestCase):
         initializer=10)
     self.assertAllEqual(880, self.evaluate(r))
 
+  @test_util.run_in_graph_and_eager_modes
+  def testFoldl_Chunked(self):
+    # Use more elements than functional_ops._UNROLL_THRESHOLD so that a
+    # while_loop is built.
+    elems = constant_op.constant(np.arange(1, 21), name="data")
+
+    for chunk_size in (3, 4):
+      r = functional_ops._foldl_impl(  # pylint: disable=protected-access
+          lambda a, x: math_ops.add(a, x), elems, chunk_size=chunk_size)
+      self.assertAllEqual(210, self.evaluate(r))
+
+      r = functional_ops._foldl_impl(  # pylint: disable=protected-access
+          lambda a, x: math_ops.add(a, x),
+          elems,
+          initializer=10,
+          chunk_size=chunk_size)
+      self.assertAllEqual(220, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testFoldl_Unrolled(self):
+    elems = constant_op.constant([1, 2, 3, 4, 5, 6], name="data")
+    r = functional_ops.foldl(lambda a, x: a + x, elems)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertFalse(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertAllEqual(21, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testFoldl_StatefulFnIsNotUnrolled(self):
+    functional_ops.foldl(
+        lambda a, x: a + random_ops.random_uniform([], seed=1),
+        array_ops.zeros([6]))
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertTrue(op_types & {"Enter", "While", "StatelessWhile"})
+
+  @test_util.run_deprecated_v1
+  def testFoldl_UnrollTrue(self):
+    # Unlike "auto", True unrolls stateful fns too.
+    functional_ops.foldl(
+        lambda a, x: a + random_ops.random_uniform([], seed=1),
+        array_ops.zeros([6]),
+        unroll=True)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertFalse(op_types & {"Enter", "While", "StatelessWhile"})
+
+  @test_util.run_deprecated_v1
+  def testFoldl_UnrollFalse(self):
+    elems = constant_op.constant([1, 2, 3, 4, 5, 6], name="data")
+    r = functional_ops.foldl(lambda a, x: a + x, elems, unroll=False)
+    r_init = functional_ops.foldl(
+        lambda a, x: a + x, elems, initializer=10, unroll=False)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertTrue(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertAllEqual(21, self.evaluate(r))
+    self.assertAllEqual(31, self.evaluate(r_init))
+
+  def testFoldl_UnrollInvalid(self):
+    with self.assertRaisesRegexp(ValueError, "unroll must be"):
+      functional_ops.foldl(lambda a, x: a + x, np.arange(3), unroll="always")
+
+  @test_util.run_deprecated_v1
+  def testFold_NoBackPropGathersElems(self):
+    nums = np.arange(20)
+    elems = constant_op.constant(nums, name="data")
+    r_l = functional_ops._foldl_impl(  # pylint: disable=protected-access
+        lambda a, x: a * 2 + x, elems, back_prop=False, chunk_size=3)
+    r_r = functional_ops.foldr(
+        lambda a, x: a * 2 + x, elems, back_prop=False)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertNotIn("TensorArrayScatterV3", op_types)
+    self.assertAllEqual(
+        functools.reduce(lambda a, x: a * 2 + x, nums), self.evaluate(r_l))
+    self.assertAllEqual(
+        functools.reduce(lambda a, x: a * 2 + x, nums[::-1]),
+        self.evaluate(r_r))
+
+  @test_util.run_deprecated_v1
+  def testFoldl_RepeatedCallsReadGlobals(self):
+    elems = constant_op.constant(np.arange(20, dtype=np.float32), name="data")
+    results = []
+    for scale in (1.0, 2.0, 3.0):
+      fold_scale[0] = scale
+      results.append(
+          functional_ops.foldl(scaled_fold_fn, elems, back_prop=False))
+    # Each call sees the scale set before it.
+    self.assertAllClose([190.0, 380.0, 570.0], self.evaluate(results))
+
   @test_util.run_in_graph_and_eager_modes
   def testFoldl_SingleInputMultiOutput(self):
     elems = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
@@ -177,6 +275,23 @@ class FunctionalOpsTest(test.TestCase):
         self.assertAllEqual(1282, self.evaluate(r))
 
   # pylint: disable=unnecessary-lambda
+  @test_util.run_in_graph_and_eager_modes
+  def testFold_LoopMultiInputMultiOutput(self):
+    nums = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    initializer = (np.array(0.0), np.array(1.0))
+    fn = lambda a, x: (a[0] * 2.0 + x[0], a[1] * x[1])
+    expected_l = functools.reduce(
+        lambda a, x: (a[0] * 2.0 + x, a[1] * x), nums, initializer)
+    expected_r = functools.reduce(
+        lambda a, x: (a[0] * 2.0 + x, a[1] * x), nums[::-1], initializer)
+
+    r = functional_ops.foldl(
+        fn, (nums, nums), initializer=initializer, unroll=False)
+    self.assertAllEqual(expected_l, self.evaluate(r))
+    r = functional_ops.foldr(
+        fn, (nums, nums), initializer=initializer, unroll=False)
+    self.assertAllEqual(expected_r, self.evaluate(r))
+
   @test_util.run_deprecated_v1
   def testFold_Grad(self):
     with self.cached_session():
@@ -193,6 +308,24 @@ class FunctionalOpsTest(test.TestCase):
       self.assertAllEqual(720.0, self.evaluate(r))
   # pylint: enable=unnecessary-lambda
 
+  @test_util.run_deprecated_v1
+  def testFold_LoopGrad(self):
+    elems = constant_op.constant([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], name="data")
+    v = constant_op.constant(2.0, name="v")
+    for fold in (functional_ops.foldl, functional_ops.foldr):
+      r = fold(lambda a, x: a * x, elems, initializer=v, unroll=False)
+      r = gradients_impl.gradients(r, v)[0]
+      self.assertAllEqual(720.0, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testFoldr_GradElems(self):
+    # Use more elements than functional_ops._UNROLL_THRESHOLD so that a
+    # while_loop is built.
+    elems = constant_op.constant(np.zeros(20, np.float32), name="data")
+    r = functional_ops.foldr(lambda a, x: a * 2.0 + x, elems)
+    grad = gradients_impl.gradients(r, elems)[0]
+    self.assertAllEqual(2.0**np.arange(20), self.evaluate(grad))
+
   @test_util.run_in_graph_and_eager_modes
   def testScan_Simple(self):
     elems = constant_op.constant([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], name="data")
@@ -223,6 +356,93 @@ class FunctionalOpsTest(test.TestCase):
                         self.evaluate(r))
     # pylint: enable=unnecessary-lambda
 
+  @test_util.run_in_graph_and_eager_modes
+  def testScan_Chunked(self):
+    # Use more elements than functional_ops._UNROLL_THRESHOLD so that a
+    # while_loop is built.
+    nums = np.arange(1, 21, dtype=np.float32)
+    elems = constant_op.constant(nums, name="data")
+    v = constant_op.constant(2.0, name="v")
+
+    # pylint: disable=unnecessary-lambda
+    for chunk_size in (3, 4):
+      r = functional_ops._scan_impl(  # pylint: disable=protected-access
+          lambda a, x: math_ops.add(a, x), elems, chunk_size=chunk_size)
+      self.assertAllEqual(np.cumsum(nums), self.evaluate(r))
+
+      r = functional_ops._scan_impl(  # pylint: disable=protected-access
+          lambda a, x: math_ops.add(a, x), elems, initializer=v,
+          reverse=True, chunk_size=chunk_size)
+      self.assertAllEqual(2. + np.cumsum(nums[::-1])[::-1], self.evaluate(r))
+    # pylint: enable=unnecessary-lambda
+
+  @test_util.run_deprecated_v1
+  def testScan_StatefulFnIsNotUnrolled(self):
+    r = functional_ops.scan(
+        lambda a, x: x + random_ops.random_uniform([], seed=1),
+        array_ops.zeros([6]),
+        initializer=0.0)
+    # Unrolled copies of the seeded random op would all produce the same
+    # value, while the loop produces a new one in each iteration.
+    self.assertLen(set(self.evaluate(r)), 6)
+
+  @test_util.run_deprecated_v1
+  def testScan_UnrollFalse(self):
+    nums = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], dtype=np.float32)
+    elems = constant_op.constant(nums, name="data")
+    r = functional_ops.scan(lambda a, x: a + x, elems, unroll=False)
+    r_rev = functional_ops.scan(
+        lambda a, x: a + x, elems, initializer=2.0, reverse=True,
+        unroll=False)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertTrue(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertAllEqual(np.cumsum(nums), self.evaluate(r))
+    self.assertAllEqual(2. + np.cumsum(nums[::-1])[::-1], self.evaluate(r_rev))
+
+  def testScan_UnrollInvalid(self):
+    with self.assertRaisesRegexp(ValueError, "unroll must be"):
+      functional_ops.scan(lambda a, x: a + x, np.arange(3), unroll="always")
+
+  @test_util.run_in_graph_and_eager_modes
+  def testScan_Associative(self):
+    for size in (1, 2, 7, 20):
+      nums = np.arange(1, size + 1, dtype=np.float32)
+      elems = constant_op.constant(nums, name="data")
+      v = constant_op.constant(2.0, name="v")
+
+      r = functional_ops.scan(math_ops.add, elems, associative=True)
+      self.assertAllEqual(np.cumsum(nums), self.evaluate(r))
+
+      r = functional_ops.scan(
+          math_ops.add, elems, initializer=v, reverse=True, associative=True)
+      self.assertAllEqual(2. + np.cumsum(nums[::-1])[::-1], self.evaluate(r))
+
+  @test_util.run_in_graph_and_eager_modes
+  def testScan_AssociativeNonCommutative(self):
+    # Matrix multiplication is associative but not commutative, so this checks
+    # that the operands are combined in order.
+    rng = np.random.RandomState(0)
+    mats = rng.uniform(size=(11, 2, 2)).astype(np.float32)
+    r = functional_ops.scan(
+        math_ops.matmul, constant_op.constant(mats), associative=True)
+    expected = [mats[0]]
+    for mat in mats[1:]:
+      expected.append(np.matmul(expected[-1], mat))
+    self.assertAllClose(np.stack(expected), self.evaluate(r))
+
+  @test_util.run_in_graph_and_eager_modes
+  def testScan_AssociativeInitializerMismatch(self):
+    elems = constant_op.constant([1.0, 2.0, 3.0])
+    with self.assertRaisesRegexp(ValueError, "same structure as elems"):
+      functional_ops.scan(
+          lambda a, x: a, elems, initializer=(0.0, 0.0), associative=True)
+    with self.assertRaisesRegexp(ValueError, "same dtypes as elems"):
+      functional_ops.scan(
+          math_ops.add,
+          elems,
+          initializer=constant_op.constant(0, dtype=dtypes.int32),
+          associative=True)
+
   @test_util.run_in_graph_and_eager_modes
   def testScan_SingleInputMultiOutput(self):
     elems = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
@@ -252,6 +472,15 @@ class FunctionalOpsTest(test.TestCase):
     self.assertAllEqual(np.cumsum(elems), r_value[0])
     self.assertAllEqual(np.cumsum(-elems), r_value[1])
 
+  @test_util.run_in_graph_and_eager_modes
+  def testScan_LoopMultiInputMultiOutput(self):
+    elems = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+    r = functional_ops.scan(
+        lambda a, x: (a[0] + x[0], a[1] * x[1]), (elems, elems), unroll=False)
+    r_value = self.evaluate(r)
+    self.assertAllEqual(np.cumsum(elems), r_value[0])
+    self.assertAllEqual(np.cumprod(elems), r_value[1])
+
   @test_util.run_in_graph_and_eager_modes
   def testScan_MultiOutputMismatchedInitializer(self):
     elems = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
@@ -331,6 +560,72 @@ class FunctionalOpsTest(test.TestCase):
       r = gradients_impl.gradients(r, v)[0]
       self.assertAllEqual(873.0, self.evaluate(r))
 
+  @test_util.run_deprecated_v1
+  def testScan_LoopGrad(self):
+    elems = constant_op.constant([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], name="data")
+    v = constant_op.constant(2.0, name="v")
+    r = functional_ops.scan(
+        lambda a, x: a * x, elems, initializer=v, unroll=False)
+    r = gradients_impl.gradients(r, v)[0]
+    self.assertAllEqual(873.0, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  @test_util.disable_control_flow_v2("Checks the v1 WhileContext.")
+  def testScan_SwapMemoryRequiresBackProp(self):
+    elems = array_ops.placeholder(dtypes.float32, shape=[None])
+    functional_ops.scan(
+        lambda a, x: a + x, elems, back_prop=False, swap_memory=True)
+    functional_ops.scan(
+        lambda a, x: a + x, elems, back_prop=True, swap_memory=True)
+    while_contexts = ops.get_collection(ops.GraphKeys.WHILE_CONTEXT)
+    self.assertEqual([False, True],
+                     [context.swap_memory for context in while_contexts])
+
+  @test_util.run_deprecated_v1
+  def testScan_XlaCompileUsesDenseResults(self):
+    nums = np.arange(20, dtype=np.float32)
+    elems = constant_op.constant(nums, name="data")
+    with ops.get_default_graph()._attr_scope(  # pylint: disable=protected-access
+        {"_XlaCompile": attr_value_pb2.AttrValue(b=True)}):
+      r = functional_ops.scan(lambda a, x: a + x, elems)
+      r_reverse = functional_ops.scan(
+          lambda a, x: a + x, elems, initializer=1.0, reverse=True)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertFalse([t for t in op_types if t.startswith("TensorArray")])
+    self.assertAllEqual(np.cumsum(nums), self.evaluate(r))
+    self.assertAllEqual(
+        np.cumsum(nums[::-1])[::-1] + 1.0, self.evaluate(r_reverse))
+
+  @test_util.run_deprecated_v1
+  @test_util.disable_control_flow_v2("Checks the v1 WhileContext.")
+  def testScan_DefaultParallelIterations(self):
+    elems = array_ops.placeholder(dtypes.float32, shape=[None])
+    functional_ops.scan(lambda a, x: a + x, elems)
+    with ops.device("/device:CPU:0"):
+      functional_ops.scan(lambda a, x: a + x, elems)
+      functional_ops.scan(lambda a, x: a + x, elems, swap_memory=True)
+    with ops.device("/device:GPU:0"):
+      functional_ops.scan(lambda a, x: a + x, elems)
+      functional_ops.scan(lambda a, x: a + x, elems, parallel_iterations=3)
+    while_contexts = ops.get_collection(ops.GraphKeys.WHILE_CONTEXT)
+    self.assertEqual(
+        [10, 8, 4, 32, 3],
+        [context.parallel_iterations for context in while_contexts])
+
+  @test_util.run_in_graph_and_eager_modes
+  def testScan_DeviceTypeInFunction(self):
+    device_types = []
+
+    @eager_def_function.function
+    def fn():
+      with ops.device("/device:GPU:0"):
+        device_types.append(functional_ops._current_device_type())  # pylint: disable=protected-access
+      return constant_op.constant(0)
+
+    # The function is only traced, so no GPU is needed.
+    fn.get_concrete_function()
+    self.assertEqual(["GPU"], device_types)
+
   @test_util.run_deprecated_v1
   def testScanGradientWithPartStopGradient(self):
     a = variables.Variable(0.0, name="a")
@@ -20,16 +20,20 @@ from __future__ import print_function
 
 import numpy as np
 
+from tensorflow.core.framework import attr_value_pb2
 from tensorflow.python.eager import context
 from tensorflow.python.framework import constant_op
 from tensorflow.python.framework import dtypes
+from tensorflow.python.framework import ops
 from tensorflow.python.framework import sparse_tensor
+from tensorflow.python.framework import tensor_spec
 from tensorflow.python.framework import test_util
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import gradients_impl
 from tensorflow.python.ops import init_ops
 from tensorflow.python.ops import map_fn
 from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import random_ops
 from tensorflow.python.ops import variable_scope
 from tensorflow.python.ops import variables
 import tensorflow.python.ops.tensor_array_grad  # pylint: disable=unused-import
@@ -48,6 +52,18 @@ def simple_scoped_fn(a, x):
     return math_ops.multiply(math_ops.add(a, x), two)
 
 
+# The arguments of each call to scale_by_dtype.
+scale_by_dtype_calls = []
+
+
+def scale_by_dtype(x):
+  """Doubles integer tensors and halves floating point ones."""
+  scale_by_dtype_calls.append(x)
+  if x.dtype.is_integer:
+    return x * 2
+  return x * 0.5
+
+
 @test_util.with_control_flow_v2
 class MapFnTest(test.TestCase):
 
@@ -60,6 +76,220 @@ class MapFnTest(test.TestCase):
     self.assertAllEqual(
         np.array([(x + 3) * 2 for x in nums]), self.evaluate(r))
 
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_Chunked(self):
+    # Use more elements than functional_ops._UNROLL_THRESHOLD, and an fn that
+    # is not elementwise, so that a while_loop is built.
+    nums = np.arange(40).reshape([20, 2])
+    elems = constant_op.constant(nums, name="data")
+    r = map_fn._map_fn_impl(  # pylint: disable=protected-access
+        lambda x: math_ops.multiply(math_ops.reduce_sum(x), 2), elems,
+        chunk_size=3)
+    self.assertAllEqual(nums.sum(axis=1) * 2, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testMap_Unrolled(self):
+    nums = np.arange(12).reshape([6, 2])
+    elems = constant_op.constant(nums, name="data")
+    r = map_fn.map_fn(
+        lambda x: math_ops.multiply(math_ops.reduce_sum(x), 2), elems)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertFalse(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertIn("Pack", op_types)
+    self.assertAllEqual(nums.sum(axis=1) * 2, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testMap_UnrolledDefaultNameScope(self):
+
+    def fn(x):
+      with variable_scope.variable_scope(None, default_name="scale"):
+        w = variable_scope.get_variable(
+            "w", [], initializer=init_ops.constant_initializer(2.0))
+      return x * w
+
+    nums = np.arange(6, dtype=np.float32)
+    r = map_fn.map_fn(fn, nums, unroll=True)
+    # All the calls to fn share the variable created by the first, as in a
+    # while_loop.
+    self.assertEqual(["scale/w"],
+                     [v.op.name for v in variables.global_variables()])
+    self.evaluate(variables.global_variables_initializer())
+    self.assertAllEqual(nums * 2.0, self.evaluate(r))
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_UnrolledChecksDtype(self):
+    nums = np.arange(6, dtype=np.float32)
+    with self.assertRaisesRegexp(TypeError, "where dtype specifies"):
+      map_fn.map_fn(lambda x: x * 2., nums, dtype=dtypes.int32)
+
+  @test_util.run_deprecated_v1
+  def testMap_StatefulFnIsNotUnrolled(self):
+    r = map_fn.map_fn(
+        lambda x: x + random_ops.random_uniform([], seed=1),
+        array_ops.zeros([6]))
+    # Unrolled copies of the seeded random op would all produce the same
+    # value, while the loop produces a new one in each iteration.
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertTrue(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertLen(set(self.evaluate(r)), 6)
+
+  @test_util.run_deprecated_v1
+  def testMap_UnrollFalse(self):
+    nums = np.arange(12).reshape([6, 2])
+    elems = constant_op.constant(nums, name="data")
+    r = map_fn.map_fn(
+        lambda x: math_ops.multiply(math_ops.reduce_sum(x), 2), elems,
+        unroll=False)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertTrue(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertAllEqual(nums.sum(axis=1) * 2, self.evaluate(r))
+
+  def testMap_UnrollAutoOnGpu(self):
+    fn = lambda x: math_ops.multiply(math_ops.reduce_sum(x), 2)
+    # The graphs are only built, so no GPU is needed.
+    for back_prop, unrolled in [(False, True), (True, False)]:
+      with ops.Graph().as_default() as g, ops.device("/device:GPU:0"):
+        map_fn.map_fn(fn, array_ops.zeros([64, 2]), back_prop=back_prop)
+      op_types = set(op.type for op in g.get_operations())
+      self.assertEqual(
+          unrolled, not op_types & {"Enter", "While", "StatelessWhile"})
+
+  def testMap_UnrollInvalid(self):
+    with self.assertRaisesRegexp(ValueError, "unroll must be"):
+      map_fn.map_fn(lambda x: x, np.arange(3), unroll="always")
+
+  @test_util.run_deprecated_v1
+  def testMap_KnownElementShape(self):
+    elems = array_ops.placeholder(dtypes.float32, shape=[None, 3])
+    fn_input_shapes = []
+
+    def fn(x):
+      fn_input_shapes.append(x.shape.as_list())
+      return math_ops.reduce_sum(x)
+
+    r = map_fn.map_fn(fn, elems)
+    self.assertTrue(fn_input_shapes)
+    for shape in fn_input_shapes:
+      self.assertEqual([3], shape)
+    with self.cached_session() as sess:
+      self.assertAllEqual(
+          [3.0, 12.0],
+          sess.run(r, feed_dict={elems: np.arange(6).reshape([2, 3])}))
+
+  @test_util.run_deprecated_v1
+  def testMap_XlaCompileUsesDenseResults(self):
+    nums = np.arange(40, dtype=np.float32).reshape([20, 2])
+    elems = constant_op.constant(nums, name="data")
+    with ops.get_default_graph()._attr_scope(  # pylint: disable=protected-access
+        {"_XlaCompile": attr_value_pb2.AttrValue(b=True)}):
+      r = map_fn.map_fn(
+          lambda x: (math_ops.reduce_sum(x), x * 2.0),
+          elems,
+          dtype=(dtypes.float32, dtypes.float32))
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertFalse([t for t in op_types if t.startswith("TensorArray")])
+    self.assertEqual([20], r[0].shape.as_list())
+    self.assertEqual([20, 2], r[1].shape.as_list())
+    received = self.evaluate(r)
+    self.assertAllEqual(nums.sum(axis=1), received[0])
+    self.assertAllEqual(nums * 2.0, received[1])
+
+  @test_util.run_deprecated_v1
+  def testMap_InputSignature(self):
+    signature = tensor_spec.TensorSpec([2], dtypes.float32)
+    nums = np.arange(40, dtype=np.float32).reshape([20, 2])
+    del scale_by_dtype_calls[:]
+    r = map_fn.map_fn(
+        scale_by_dtype, nums, back_prop=False, input_signature=signature)
+    r_next = map_fn.map_fn(
+        scale_by_dtype, nums + 1.0, back_prop=False,
+        input_signature=signature)
+    # Both calls share one function traced for the signature.
+    self.assertLen(scale_by_dtype_calls, 1)
+    self.assertEqual([20, 2], r.shape.as_list())
+    self.assertAllEqual(nums * 0.5, self.evaluate(r))
+    self.assertAllEqual((nums + 1.0) * 0.5, self.evaluate(r_next))
+
+  @test_util.run_deprecated_v1
+  def testMap_InputSignatureGrad(self):
+    signature = tensor_spec.TensorSpec([2], dtypes.float32)
+    elems = constant_op.constant(
+        np.arange(40, dtype=np.float32).reshape([20, 2]))
+    r = map_fn.map_fn(scale_by_dtype, elems, input_signature=signature)
+    grad = gradients_impl.gradients(r, elems)[0]
+    # With back propagation fn is not traced into a Defun, whose gradient
+    # would be computed with SymbolicGradient.
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertNotIn("SymbolicGradient", op_types)
+    self.assertAllEqual(np.full([20, 2], 0.5), self.evaluate(grad))
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_InputSignatureMismatch(self):
+    with self.assertRaisesRegexp(ValueError, "do not match input_signature"):
+      map_fn.map_fn(
+          lambda x: x,
+          np.zeros([3, 2], np.float32),
+          input_signature=tensor_spec.TensorSpec([3], dtypes.float32))
+
+  @test_util.run_deprecated_v1
+  def testMap_Elementwise(self):
+    nums = np.arange(20)
+    elems = constant_op.constant(nums, name="data")
+    r = map_fn.map_fn(
+        lambda x: math_ops.multiply(math_ops.add(x, 3), 2), elems,
+        use_vectorized_map=True)
+    graph_ops = ops.get_default_graph().get_operations()
+    op_types = set(op.type for op in graph_ops)
+    self.assertFalse(op_types & {"Enter", "While", "StatelessWhile", "Pack"})
+    self.assertFalse([op for op in graph_ops if "loop_body" in op.name])
+    self.assertAllEqual((nums + 3) * 2, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testMap_ElementwiseRequiresVectorizedMap(self):
+    nums = np.arange(20)
+    r = map_fn.map_fn(lambda x: x * 2, nums, unroll=False)
+    op_types = set(op.type for op in ops.get_default_graph().get_operations())
+    self.assertTrue(op_types & {"Enter", "While", "StatelessWhile"})
+    self.assertAllEqual(nums * 2, self.evaluate(r))
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_ShapeDependentFnIsNotElementwise(self):
+    nums = np.arange(80, dtype=np.float32).reshape([20, 4])
+    # Given all the elements at once, fn would divide by 80 instead of 4.
+    r = map_fn.map_fn(lambda x: x / x.shape.num_elements(), nums,
+                      use_vectorized_map=True)
+    self.assertAllClose(nums / 4.0, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testMap_ElementwiseCheckKeepsVariableScopeNames(self):
+
+    def fn(x):
+      with variable_scope.variable_scope(None, default_name="scale"):
+        w = variable_scope.get_variable(
+            "w", [], initializer=init_ops.constant_initializer(2.0))
+      return x * w
+
+    nums = np.arange(20, dtype=np.float32)
+    r = map_fn.map_fn(fn, nums, use_vectorized_map=True)
+    # Checking whether fn is elementwise does not use up the "scale" name.
+    self.assertEqual(["scale/w"],
+                     [v.op.name for v in variables.global_variables()])
+    self.evaluate(variables.global_variables_initializer())
+    self.assertAllEqual(nums * 2.0, self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testMap_ElementwiseCapturedTensorUsesPfor(self):
+    nums = np.arange(20)
+    elems = constant_op.constant(nums, name="data")
+    offset = constant_op.constant(np.arange(20), name="offset")
+    # The captured tensor is not broadcast along with the elements, so fn
+    # must not be applied to all of them at once.
+    r = map_fn.map_fn(lambda x: math_ops.add(x, offset[0]), elems,
+                      use_vectorized_map=True)
+    self.assertTrue([op for op in ops.get_default_graph().get_operations()
+                     if "loop_body" in op.name])
+    self.assertAllEqual(nums, self.evaluate(r))
+
   def testMapDtypeEager(self):
     with context.eager_mode():
       dtype = map_fn.map_fn(lambda x: constant_op.constant(""),
@@ -128,6 +358,18 @@ class MapFnTest(test.TestCase):
       r = gradients_impl.gradients(y, elems)[0]
       self.assertAllEqual([4.0, 8.0, 12.0, 16.0, 20.0, 24.0], self.evaluate(r))
 
+  @test_util.run_deprecated_v1
+  def testMap_LoopGrad(self):
+    param = constant_op.constant(2.0)
+    elems = constant_op.constant([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], name="elems")
+    y = map_fn.map_fn(
+        lambda x: math_ops.multiply(math_ops.square(x), param), elems,
+        unroll=False)
+    r = gradients_impl.gradients(y, param)[0]
+    self.assertAllEqual(91.0, self.evaluate(r))
+    r = gradients_impl.gradients(y, elems)[0]
+    self.assertAllEqual([4.0, 8.0, 12.0, 16.0, 20.0, 24.0], self.evaluate(r))
+
   @test_util.run_in_graph_and_eager_modes
   def testMap_SimpleNotTensor(self):
     nums = np.array([1, 2, 3, 4, 5, 6])
@@ -150,6 +392,39 @@ class MapFnTest(test.TestCase):
     self.assertAllEqual((nums + 3) * 2, received[0])
     self.assertAllEqual(-(nums + 3) * 2, received[1])
 
+  @test_util.run_deprecated_v1
+  @test_util.disable_control_flow_v2("Checks the v1 WhileContext.")
+  def testMap_MultiOutputSingleLoop(self):
+    nums = np.arange(40).reshape([20, 2])
+    r = map_fn.map_fn(
+        lambda x: (math_ops.reduce_sum(x), math_ops.reduce_prod(x)),
+        nums,
+        dtype=(dtypes.int64, dtypes.int64))
+    # Both outputs are written to by the same loop.
+    self.assertLen(ops.get_collection(ops.GraphKeys.WHILE_CONTEXT), 1)
+    received = self.evaluate(r)
+    self.assertAllEqual(nums.sum(axis=1), received[0])
+    self.assertAllEqual(nums.prod(axis=1), received[1])
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_ProfileIterations(self):
+    nums = np.arange(20)
+    with test.mock.patch.object(map_fn.logging, "info") as mock_info:
+      r = map_fn.map_fn(lambda x: x * 2, nums, profile_iterations=True)
+      self.assertAllEqual(nums * 2, self.evaluate(r))
+    # The times of all 20 calls to fn are reported once the loop is done.
+    mock_info.assert_called_once()
+    self.assertEqual(20, mock_info.call_args[0][2])
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_ProfileIterationsWithoutBackProp(self):
+    nums = np.arange(20)
+    with test.mock.patch.object(map_fn.logging, "info") as mock_info:
+      r = map_fn.map_fn(
+          lambda x: x * 2, nums, back_prop=False, profile_iterations=True)
+      self.assertAllEqual(nums * 2, self.evaluate(r))
+    mock_info.assert_called_once()
+
   @test_util.run_in_graph_and_eager_modes
   def testMap_MultiOutputMismatchedDtype(self):
     nums = np.array([1, 2, 3, 4, 5, 6])
@@ -185,6 +460,74 @@ class MapFnTest(test.TestCase):
     self.assertAllEqual(-nums, received[1])
     self.assertAllEqual(nums, received[2])
 
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_LoopMultiInputMultiOutput(self):
+    nums = np.array([1, 2, 3, 4, 5, 6])
+    r = map_fn.map_fn(
+        lambda x: (x[0] * x[1][0], (x[1][1], x[0] + 1)),
+        (nums, (2 * nums, -nums)),
+        unroll=False)
+    received = self.evaluate([r[0], r[1][0], r[1][1]])
+    self.assertAllEqual(2 * nums * nums, received[0])
+    self.assertAllEqual(-nums, received[1])
+    self.assertAllEqual(nums + 1, received[2])
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_VectorizedMap(self):
+    nums = np.array([[1., 2.], [3., 4.], [5., 6.]], dtype=np.float32)
+    r = map_fn.map_fn(
+        lambda x: (math_ops.reduce_sum(x), x * 2.),
+        nums,
+        dtype=(dtypes.float32, dtypes.float32),
+        use_vectorized_map=True)
+    self.assertEqual((3,), r[0].get_shape())
+    self.assertEqual((3, 2), r[1].get_shape())
+    received = self.evaluate(r)
+    self.assertAllEqual(nums.sum(axis=1), received[0])
+    self.assertAllEqual(nums * 2., received[1])
+
+  @test_util.run_deprecated_v1
+  def testMap_VectorizedMapFallbackLeavesNoOps(self):
+    nums = np.array([[1., 2.], [3., 3.], [5., 6.]], dtype=np.float32)
+    # pfor has no converter for Unique.
+    r = map_fn.map_fn(
+        lambda x: math_ops.reduce_sum(array_ops.unique(x)[0]),
+        nums,
+        use_vectorized_map=True)
+    self.assertFalse([op for op in ops.get_default_graph().get_operations()
+                      if "loop_body" in op.name])
+    self.assertAllEqual([3., 3., 11.], self.evaluate(r))
+
+  @test_util.run_deprecated_v1
+  def testMap_VectorizedMapFallbackReusesVariables(self):
+
+    def fn(x):
+      with variable_scope.variable_scope(None, default_name="scale"):
+        w = variable_scope.get_variable(
+            "w", [], initializer=init_ops.constant_initializer(2.0))
+      return math_ops.reduce_sum(array_ops.unique(x)[0]) * w
+
+    nums = np.array([[1., 2.], [3., 3.], [5., 6.]], dtype=np.float32)
+    r = map_fn.map_fn(fn, nums, use_vectorized_map=True)
+    self.assertEqual(["scale/w"],
+                     [v.op.name for v in variables.global_variables()])
+    self.evaluate(variables.global_variables_initializer())
+    self.assertAllEqual([6., 6., 22.], self.evaluate(r))
+
+  @test_util.run_in_graph_and_eager_modes
+  def testMap_VectorizedMapChecksArguments(self):
+    nums = np.array([[1., 2.], [3., 4.]], dtype=np.float32)
+    with self.assertRaisesRegexp(TypeError, "where dtype specifies"):
+      map_fn.map_fn(lambda x: x * 2., nums, dtype=dtypes.int32,
+                    use_vectorized_map=True)
+    with self.assertRaisesRegexp(ValueError, "do not match input_signature"):
+      map_fn.map_fn(
+          lambda x: x * 2., nums, use_vectorized_map=True,
+          input_signature=tensor_spec.TensorSpec([3], dtypes.float32))
+    with self.assertRaisesRegexp(ValueError, "unroll cannot be set"):
+      map_fn.map_fn(lambda x: x * 2., nums, use_vectorized_map=True,
+                    unroll=False)
+
   @test_util.run_in_graph_and_eager_modes
   def testMapShape(self):
     x = constant_op.constant([[1, 2, 3], [4, 5, 6]])
@@ -2561,7 +2561,12 @@ def while_loop(cond,
   main source of memory consumption and often cause OOM errors when training
   on GPUs. When the flag swap_memory is true, we swap out these tensors from
   GPU to CPU. This for example allows us to train RNN models with very long
-  sequences and large batches.
+  sequences and large batches. With control flow v1, a tensor is only
+  swapped out if it is larger than 2KB and more than 70% of the GPU memory is
+  in use when it is stored, and the copies are made asynchronously on the
+  device's dedicated device-to-host and host-to-device streams, so they
+  overlap with the computation of other iterations. Loops built with control
+  flow v2, the default in TensorFlow 2, ignore swap_memory.
 
   Args:
     cond: A callable that represents the termination condition of the loop.
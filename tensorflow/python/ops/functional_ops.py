@@ -18,15 +18,23 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import copy
+import types
+import weakref
+
 from tensorflow.core.framework import attr_value_pb2
 from tensorflow.python.eager import context
 from tensorflow.python.framework import constant_op
+from tensorflow.python.framework import device as pydev
 from tensorflow.python.framework import dtypes
+from tensorflow.python.framework import func_graph as func_graph_module
 from tensorflow.python.framework import function
 from tensorflow.python.framework import ops
 from tensorflow.python.framework import tensor_shape
+from tensorflow.python.framework import tensor_spec
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import control_flow_ops
+from tensorflow.python.ops import control_flow_util
 from tensorflow.python.ops import gen_functional_ops
 from tensorflow.python.ops import math_ops
 from tensorflow.python.ops import tensor_array_ops
@@ -39,18 +47,559 @@ from tensorflow.python.util import compat
 from tensorflow.python.util import deprecation
 from tensorflow.python.util import function_utils
 from tensorflow.python.util import nest
+from tensorflow.python.util import tf_contextlib
 from tensorflow.python.util.tf_export import tf_export
 
 
+# Values used by `_default_parallel_iterations`.  The GPU value keeps the
+# device pipeline full, while on CPU running many more iterations than there
+# are cores only grows the working set.  The CPU value is fixed rather than
+# taken from the number of cores, which would make the graph depend on the
+# machine building it.  Swapping loops are kept shallow so the device<->host
+# copies do not fall behind the computation.
+_DEFAULT_PARALLEL_ITERATIONS = 10
+_GPU_PARALLEL_ITERATIONS = 32
+_CPU_PARALLEL_ITERATIONS = 8
+_SWAP_MEMORY_PARALLEL_ITERATIONS = 4
+
+
+def _current_device_type():
+  """Returns the device type of the enclosing device scope, or None."""
+  device = ops.current_device_name()
+  return pydev.DeviceSpec.from_string(device).device_type if device else None
+
+
+def _default_parallel_iterations(n, swap_memory, back_prop):
+  """Picks `parallel_iterations` for a loop when the caller did not set it.
+
+  The choice depends on the type of the device the loop is placed on by the
+  enclosing device scope:
+
+    * GPU: 32, or `n` if it is statically known and smaller.
+    * CPU: 8, or `n` if it is statically known and smaller.
+    * Unknown: 10.
+
+  The result is capped at 4 if tensors will be swapped to host memory, i.e. if
+  both `swap_memory` and `back_prop` are True.
+
+  Args:
+    n: The number of loop iterations, as a Python integer if known statically.
+    swap_memory: Whether the loop enables GPU-CPU memory swapping.
+    back_prop: Whether the loop supports back propagation.
+
+  Returns:
+    A positive Python integer.
+  """
+  device_type = _current_device_type()
+  n_static = n if isinstance(n, int) else None
+  if device_type == "GPU":
+    parallel_iterations = min(n_static or _GPU_PARALLEL_ITERATIONS,
+                              _GPU_PARALLEL_ITERATIONS)
+  elif device_type == "CPU":
+    parallel_iterations = min(n_static or _CPU_PARALLEL_ITERATIONS,
+                              _CPU_PARALLEL_ITERATIONS)
+  else:
+    parallel_iterations = _DEFAULT_PARALLEL_ITERATIONS
+  if swap_memory and back_prop:
+    parallel_iterations = min(parallel_iterations,
+                              _SWAP_MEMORY_PARALLEL_ITERATIONS)
+  return max(parallel_iterations, 1)
+
+
+def _get_leading_dim(elems_flat):
+  """Returns the size of the first (unpack) dimension shared by `elems_flat`.
+
+  If any of the tensors has a statically known leading dimension it is returned
+  as a Python integer, so that loop bounds and `TensorArray` sizes are
+  constants rather than the output of a runtime `Shape` op.
+
+  Args:
+    elems_flat: A non-empty list of tensors of rank at least 1.
+
+  Returns:
+    A Python integer, or a scalar int32 `Tensor` if no leading dimension is
+    known statically.
+  """
+  for elem in elems_flat:
+    if elem.shape.rank:
+      n = tensor_shape.dimension_value(elem.shape[0])
+      if n is not None:
+        return n
+  return array_ops.shape(elems_flat[0])[0]
+
+
+# Loops over at most this many statically known elements are unrolled into
+# straight-line graphs instead of being built as a `while_loop`.  On GPU the
+# launch overhead of each iteration dominates small loop bodies, so loops that
+# are not differentiated, and whose unrolled graph therefore has no gradient
+# to grow with it, are unrolled up to a larger size.
+_UNROLL_THRESHOLD = 16
+_GPU_UNROLL_THRESHOLD = 64
+
+
+def _should_unroll(n, fn, args, unroll="auto", back_prop=True):
+  """Returns True if a loop over `n` elements should be unrolled.
+
+  Args:
+    n: The number of loop iterations, as a Python integer if known statically.
+    fn: The callable passed to map_fn, foldl, foldr or scan.
+    args: The arguments of `fn`, as passed to `_is_stateless`.
+    unroll: True to unroll any loop of statically known size, False to never
+      unroll, or "auto" to unroll loops up to the thresholds above if `fn` is
+      stateless.
+    back_prop: Whether the loop supports back propagation.
+
+  Returns:
+    A Python boolean.
+  """
+  if not isinstance(n, int) or n < 1 or unroll is False:
+    return False
+  if unroll is True:
+    return True
+  threshold = _UNROLL_THRESHOLD
+  if not back_prop and _current_device_type() == "GPU":
+    threshold = _GPU_UNROLL_THRESHOLD
+  return n <= threshold and _is_stateless(fn, args)
+
+
+def _is_stateless(fn, args):
+  """Returns True if calling `fn` on `args` creates no stateful ops.
+
+  A `while_loop` runs the ops `fn` creates once per element, while unrolled
+  calls to `fn` each create their own ops.  For stateful ops these are not
+  the same: unrolled copies of a seeded random op, for example, all produce
+  the same values.  `fn` is traced in a throwaway graph to check for them.
+
+  Args:
+    fn: The callable passed to map_fn, foldl, foldr or scan.
+    args: A tuple of the arguments `fn` is called with, in which tensors may
+      be replaced by `tf.TensorSpec`s describing them.
+
+  Returns:
+    A Python boolean, False if `fn` creates variables or fails to be traced.
+  """
+  if context.executing_eagerly():
+    return True
+  args_flat = nest.flatten(args)
+  arg_specs = [(arg.dtype, arg.shape) for arg in args_flat
+               if isinstance(arg, tensor_spec.TensorSpec)]
+
+  def traced_fn(*placeholders):
+    placeholders = iter(placeholders)
+    traced_args = [
+        next(placeholders) if isinstance(arg, tensor_spec.TensorSpec) else arg
+        for arg in args_flat
+    ]
+    return fn(*nest.pack_sequence_as(args, traced_args))
+
+  try:
+    graph, _, _ = _trace_isolated(traced_fn, arg_specs, "unroll_probe")
+  except _TraceRejected:
+    return False
+  return not any(op._is_stateful for op in graph.get_operations())  # pylint: disable=protected-access
+
+
+def _slice_specs(elems, elems_flat):
+  """Returns `tf.TensorSpec`s for the slices of `elems`, packed like it."""
+  return nest.pack_sequence_as(
+      elems,
+      [tensor_spec.TensorSpec(elem.shape[1:], elem.dtype)
+       for elem in elems_flat])
+
+
+def _unstack_rows(elems_flat, n):
+  """Unstacks `elems_flat` into `n` lists holding one slice of each tensor."""
+  columns = [array_ops.unstack(elem, num=n) for elem in elems_flat]
+  return [list(row) for row in zip(*columns)]
+
+
+def _variable_scope_counts():
+  """Returns a copy of the counts of the variable scopes opened so far."""
+  return dict(vs.get_variable_scope_store().variable_scopes_count)
+
+
+@tf_contextlib.contextmanager
+def _unrolled_variable_scope(step, scope_counts):
+  """Enters the variable scope for the `step`-th call of an unrolled `fn`.
+
+  The body of a `while_loop` is traced once, so `get_variable` calls in `fn`
+  create each variable once, and each variable scope `fn` opens is named
+  once.  Unrolled calls after the first reuse the variables created by the
+  first call to keep that behavior.  They also see the variable scope counts
+  the first call saw, so that scopes opened with a `default_name` get the
+  same names as in the first call.
+
+  Args:
+    step: The index of the call to `fn`.
+    scope_counts: The result of `_variable_scope_counts()` before the first
+      call to `fn`.
+
+  Yields:
+    Nothing.
+  """
+  if step == 0 or context.executing_eagerly():
+    yield
+    return
+  scope_store = vs.get_variable_scope_store()
+  first_call_counts = scope_store.variable_scopes_count
+  scope_store.variable_scopes_count = dict(scope_counts)
+  try:
+    with vs.variable_scope(
+        vs.get_variable_scope(), reuse=True, auxiliary_name_scope=False):
+      yield
+  finally:
+    scope_store.variable_scopes_count = first_call_counts
+
+
+def _fold_unrolled(fn, elems, elems_flat, n, initializer, back_prop):
+  """Folds `fn` over the `n` slices of `elems` without a `while_loop`."""
+  rows = _unstack_rows(elems_flat, n)
+  if initializer is None:
+    a = nest.pack_sequence_as(elems, rows.pop(0))
+  else:
+    a = initializer
+  scope_counts = _variable_scope_counts()
+  for step, row in enumerate(rows):
+    with _unrolled_variable_scope(step, scope_counts):
+      a = fn(a, nest.pack_sequence_as(elems, row))
+  if not back_prop:
+    a = nest.map_structure(array_ops.stop_gradient, a)
+  return a
+
+
+def _chunk_indices(i, chunk_size, reverse=False):
+  """Returns the indices of the `chunk_size` consecutive elements from `i`.
+
+  Args:
+    i: The index of the first element.
+    chunk_size: The number of consecutive elements.
+    reverse: (optional) True selects `i, i - 1, ...` instead of `i, i + 1, ...`.
+
+  Returns:
+    `i` itself if `chunk_size` is 1, otherwise a vector of `chunk_size` indices.
+  """
+  if chunk_size == 1:
+    return i
+  if reverse:
+    return math_ops.range(i, i - chunk_size, -1)
+  return math_ops.range(i, i + chunk_size)
+
+
+def _read_chunk(tas, indices, chunk_size):
+  """Reads the elements at `indices` from each of `tas`.
+
+  For `chunk_size > 1` the elements are fetched with a single `gather` per
+  `TensorArray` rather than one `read` per element.
+
+  Args:
+    tas: A flat list of `TensorArray`s.
+    indices: The indices to read, as returned by `_chunk_indices`.
+    chunk_size: The number of elements to read.
+
+  Returns:
+    A list of `chunk_size` lists, the j-th of which holds the j-th element read
+    from each of `tas`.
+  """
+  if chunk_size == 1:
+    return [[ta.read(indices) for ta in tas]]
+  columns = [
+      array_ops.unstack(ta.gather(indices), num=chunk_size) for ta in tas
+  ]
+  return [list(row) for row in zip(*columns)]
+
+
+class _GatherReader(object):
+  """Reads the elements of a tensor through the `TensorArray` read methods.
+
+  Loops built without back propagation use this in place of a `TensorArray`
+  unstacked from the tensor: the elements are gathered from the tensor when
+  they are needed instead of all being written to a `TensorArray` up front.
+  """
+
+  def __init__(self, value):
+    self._value = value
+
+  def read(self, index):
+    return array_ops.gather(self._value, index)
+
+  def gather(self, indices):
+    return array_ops.gather(self._value, indices)
+
+
+def _write_chunk(tas, indices, rows):
+  """Writes `rows` at `indices` to `tas`, the inverse of `_read_chunk`.
+
+  For more than one row the values are written with a single `scatter` per
+  `TensorArray` rather than one `write` per element.
+
+  Args:
+    tas: A flat list of `TensorArray`s.
+    indices: The indices to write, as returned by `_chunk_indices`.
+    rows: A list of lists, the j-th of which holds the j-th value to write to
+      each of `tas`.
+
+  Returns:
+    The updated list of `TensorArray`s.
+  """
+  if len(rows) == 1:
+    return [ta.write(indices, value) for ta, value in zip(tas, rows[0])]
+  return [
+      ta.scatter(indices, array_ops.stack(values))
+      for ta, values in zip(tas, zip(*rows))
+  ]
+
+
+def _use_dense_accumulators(n):
+  """Returns True if a loop over `n` elements should avoid `TensorArray`s.
+
+  Loops compiled by XLA keep their results in dense tensors updated in place,
+  which XLA can fuse with the loop body, instead of in `TensorArray`s.  This
+  is done under `jit_scope` and inside XLA compiled functions, as long as `n`
+  is static, which XLA needs anyway.
+
+  Args:
+    n: The number of elements, as a Python integer if known statically.
+
+  Returns:
+    A Python bool.
+  """
+  if not isinstance(n, int) or n < 1 or context.executing_eagerly():
+    return False
+  graph = ops.get_default_graph()
+  xla_compile = graph._attr_scope_map.get("_XlaCompile")  # pylint: disable=protected-access
+  if isinstance(xla_compile, attr_value_pb2.AttrValue) and xla_compile.b:
+    return True
+  return control_flow_util.GraphOrParentsInXlaContext(graph)
+
+
+def _dense_accumulator(n, row):
+  """Returns a tensor of `n` zero rows with the shape and dtype of `row`."""
+  acc = array_ops.zeros(
+      array_ops.concat([[n], array_ops.shape(row)], 0), dtype=row.dtype)
+  acc.set_shape(tensor_shape.TensorShape([n]).concatenate(row.shape))
+  return acc
+
+
+def _write_row(acc, index, row):
+  """Returns `acc` with the row at `index` replaced by `row`."""
+  return array_ops.tensor_scatter_update(
+      acc, array_ops.reshape(index, [1, 1]), array_ops.expand_dims(row, 0))
+
+
+def _get_chunk_size(chunk_size, n):
+  """Returns the chunk size to use for a loop over `n` elements.
+
+  Chunking is only applied when `n` is known statically, since the leftover
+  elements are then processed outside of the loop.
+
+  Args:
+    chunk_size: The requested number of elements per loop iteration.
+    n: The number of elements, a Python integer or a scalar `Tensor`.
+
+  Returns:
+    A positive Python integer.
+
+  Raises:
+    ValueError: if `chunk_size` is not positive.
+  """
+  if chunk_size < 1:
+    raise ValueError("chunk_size must be positive, got %d." % chunk_size)
+  return chunk_size if isinstance(n, int) else 1
+
+
+def _interleave(evens, odds, num_odds):
+  """Interleaves the rows of `evens` and `odds`, starting with `evens`.
+
+  Args:
+    evens: A tensor with `num_odds` or `num_odds + 1` rows.
+    odds: A tensor with `num_odds` rows.
+    num_odds: The number of rows of `odds`, a Python integer.
+
+  Returns:
+    A tensor whose even rows come from `evens` and odd rows from `odds`.
+  """
+  pairs = array_ops.stack([evens[:num_odds], odds], axis=1)
+  interleaved = array_ops.reshape(
+      pairs,
+      array_ops.concat([[2 * num_odds], array_ops.shape(pairs)[2:]], axis=0))
+  interleaved.set_shape(
+      tensor_shape.TensorShape([2 * num_odds]).concatenate(pairs.shape[2:]))
+  return array_ops.concat([interleaved, evens[num_odds:]], axis=0)
+
+
+def _scan_associative(combine, elems_flat, n):
+  """Computes an inclusive prefix scan of `elems_flat` along dimension 0.
+
+  This is the work-efficient odd-even parallel scan: adjacent pairs are
+  combined, the half-size sequence of pairs is scanned recursively, and the
+  results for the remaining positions are filled in with one more combination.
+  Every level combines all of its pairs with a single call to `combine`, so the
+  graph has O(log(n)) sequential levels instead of `n` loop iterations.
+
+  Args:
+    combine: An associative callable taking two flat lists of tensors, each of
+      which is batched along dimension 0, and returning their elementwise
+      combination as a flat list of tensors.
+    elems_flat: A flat list of tensors with `n` rows each.
+    n: The number of rows, a positive Python integer.
+
+  Returns:
+    A flat list of tensors whose i-th row is the combination of rows `0..i` of
+    `elems_flat`.
+  """
+  if n < 2:
+    return elems_flat
+  num_odds = n // 2
+  # pairs[k] = combine(elems[2k], elems[2k + 1]).
+  pairs = combine([elem[0:2 * num_odds:2] for elem in elems_flat],
+                  [elem[1::2] for elem in elems_flat])
+  # odds[k] is the prefix ending at row 2k + 1.
+  odds = _scan_associative(combine, pairs, num_odds)
+  # The prefix ending at row 2k, k > 0, is combine(odds[k - 1], elems[2k]).
+  num_evens = n - num_odds
+  if num_evens > 1:
+    evens = combine([odd[:num_evens - 1] for odd in odds],
+                    [elem[2::2] for elem in elems_flat])
+    evens = [
+        array_ops.concat([elem[:1], even], axis=0)
+        for elem, even in zip(elems_flat, evens)
+    ]
+  else:
+    evens = [elem[:1] for elem in elems_flat]
+  return [
+      _interleave(even, odd, num_odds) for even, odd in zip(evens, odds)
+  ]
+
+
+class _TraceRejected(Exception):
+  """Raised when tracing `fn` in isolation shows it cannot be used."""
+  pass
+
+
+class _VariableCreationRejected(_TraceRejected):
+  """Raised when `fn` creates a variable while being traced in isolation."""
+  pass
+
+
+def _reject_variable_creation(next_creator, **kwargs):
+  del next_creator, kwargs  # Unused.
+  raise _VariableCreationRejected("fn creates variables")
+
+
+def _trace_isolated(fn, arg_specs, name):
+  """Calls `fn` on placeholders in a throwaway `FuncGraph`.
+
+  The trace does not change the calling graph: tensors from it that `fn` uses
+  show up as captures of the returned graph, and creating a variable aborts
+  the trace.  `fn` sees the current variable scope, but the variable scopes
+  it opens are counted separately from those of the calling graph, so that
+  the names of scopes opened later with a `default_name` do not change.
+
+  Args:
+    fn: The callable to trace.  It is called with one tensor per spec.
+    arg_specs: A list of `(dtype, shape)` pairs describing the arguments.
+    name: The name of the throwaway graph.
+
+  Returns:
+    A tuple `(graph, args, outputs)` of the graph, the placeholders passed to
+    `fn` and the value returned by `fn`.
+
+  Raises:
+    _TraceRejected: if `fn` creates a variable or raises an exception.
+  """
+  outer_store = vs.get_variable_scope_store()
+  scope_store = vs._VariableScopeStore()  # pylint: disable=protected-access
+  scope_store.current_scope = copy.copy(outer_store.current_scope)
+  scope_store.variable_scopes_count = dict(outer_store.variable_scopes_count)
+  graph = func_graph_module.FuncGraph(name)
+  # A FuncGraph shares the variable scope store of the calling graph.
+  graph.clear_collection(vs._VARSCOPESTORE_KEY)  # pylint: disable=protected-access
+  graph.add_to_collection(vs._VARSCOPESTORE_KEY, scope_store)  # pylint: disable=protected-access
+  with graph.as_default(), vs.variable_creator_scope(
+      _reject_variable_creation):
+    args = [array_ops.placeholder(dtype, shape) for dtype, shape in arg_specs]
+    try:
+      outputs = fn(*args)
+    except _TraceRejected:
+      raise
+    except Exception as e:  # pylint: disable=broad-except
+      raise _TraceRejected("tracing fn raised %r" % e)
+  return graph, args, outputs
+
+
+# Per-graph memo of the functions traced for the `input_signature` of map_fn,
+# used to avoid tracing them again on repeated calls.  Entries are dropped
+# along with their graph.
+_FN_CACHE = weakref.WeakKeyDictionary()
+
+
+def _get_fn_cache(fn, arg_specs):
+  """Returns a dict for memoizing facts about `fn` called with `arg_specs`.
+
+  Only Python functions without a closure are memoized, since the tensors a
+  function builds may otherwise depend on values other than its arguments
+  that can change between calls.  A memoized function does not see changes to
+  global state it reads either, so callers only memoize functions whose reuse
+  the user asked for.
+
+  Args:
+    fn: The callable passed to map_fn.
+    arg_specs: A list of `(dtype, shape)` pairs describing the arguments `fn`
+      is called with.
+
+  Returns:
+    A dict shared by all calls with the same `fn` and `arg_specs` in the
+    current graph, or None if `fn` cannot be memoized.
+  """
+  if (context.executing_eagerly() or
+      not isinstance(fn, types.FunctionType) or fn.__closure__):
+    return None
+  shapes = [tensor_shape.TensorShape(shape) for _, shape in arg_specs]
+  key = (fn, tuple(
+      (dtype, tuple(shape.as_list()) if shape.rank is not None else None)
+      for (dtype, _), shape in zip(arg_specs, shapes)))
+  graph_cache = _FN_CACHE.setdefault(ops.get_default_graph(), {})
+  return graph_cache.setdefault(key, {})
+
+
+def _make_defun(fn, arg_specs):
+  """Wraps `fn` in a `Defun` taking tensors described by `arg_specs`.
+
+  Unlike a plain `Defun`, the arguments keep the static shapes in `arg_specs`
+  while `fn` is traced, and the outputs keep the static shapes `fn` gave them.
+
+  Args:
+    fn: A callable taking one tensor per spec and returning a tensor or a flat
+      list of tensors.
+    arg_specs: A list of `(dtype, shape)` pairs describing the arguments.
+
+  Returns:
+    A `Defun`.
+  """
+  output_shapes = []
+
+  def traced_fn(*args):
+    for arg, (_, shape) in zip(args, arg_specs):
+      arg.set_shape(shape)
+    outputs = nest.map_structure(ops.convert_to_tensor, fn(*args))
+    output_shapes.extend(output.shape for output in nest.flatten(outputs))
+    return outputs
+
+  return function.Defun(
+      *[dtype for dtype, _ in arg_specs],
+      shape_func=lambda op: output_shapes)(traced_fn)
+
+
 # TODO(yuanbyu, mrry): Handle stride to support sliding windows.
 @tf_export(v1=["foldl"])
 def foldl(fn,
           elems,
           initializer=None,
-          parallel_iterations=10,
+          parallel_iterations=None,
           back_prop=True,
           swap_memory=False,
-          name=None):
+          name=None,
+          unroll="auto"):
   """foldl on the list of tensors unpacked from `elems` on dimension 0.
 
   This foldl operator repeatedly applies the callable `fn` to a sequence
@@ -79,10 +628,22 @@ def foldl(fn,
     initializer: (optional) A tensor or (possibly nested) sequence of tensors,
       as the initial value for the accumulator.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel.
+      parallel.  If None, it is chosen from the type of the device the loop is
+      placed on.
     back_prop: (optional) True enables support for back propagation.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     name: (optional) Name prefix for the returned tensors.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements if `fn` creates no variables and no stateful
+      ops, which `fn` is traced once more to check.  Unrolled calls to `fn`
+      each create their own stateful ops, so that for example a seeded random
+      op in `fn` gives the same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors, resulting from applying
@@ -91,6 +652,7 @@ def foldl(fn,
 
   Raises:
     TypeError: if `fn` is not callable.
+    ValueError: if `unroll` is not True, False or "auto".
 
   Example:
     ```python
@@ -99,13 +661,41 @@ def foldl(fn,
     # sum == 21
     ```
   """
+  return _foldl_impl(
+      fn=fn,
+      elems=elems,
+      initializer=initializer,
+      parallel_iterations=parallel_iterations,
+      back_prop=back_prop,
+      swap_memory=swap_memory,
+      name=name,
+      unroll=unroll)
+
+
+def _foldl_impl(fn,
+                elems,
+                initializer=None,
+                parallel_iterations=None,
+                back_prop=True,
+                swap_memory=False,
+                name=None,
+                unroll="auto",
+                chunk_size=1):
+  """Implements `foldl`, folding `chunk_size` elements per loop iteration.
+
+  Chunking trades a larger loop body for fewer loop iterations.  The leftover
+  elements are folded in after the loop.
+  """
   if not callable(fn):
     raise TypeError("fn must be callable.")
+  if unroll is not True and unroll is not False and unroll != "auto":
+    raise ValueError("unroll must be True, False or 'auto', got %r" % (unroll,))
 
+  # The TensorArrays are colocated with elems by their first write, unstack.
   def create_ta(elem):
     return tensor_array_ops.TensorArray(
         dtype=elem.dtype, size=n, dynamic_size=False,
-        infer_shape=True).unstack(elem)
+        element_shape=elem.shape[1:], infer_shape=True).unstack(elem)
 
   in_graph_mode = not context.executing_eagerly()
   with ops.name_scope(name, "foldl", [elems]):
@@ -126,31 +716,61 @@ def foldl(fn,
     elems_flat = [
         ops.convert_to_tensor(elem, name="elem") for elem in nest.flatten(elems)
     ]
-    n = (
-        tensor_shape.dimension_value(elems_flat[0].shape[0]) or
-        array_ops.shape(elems_flat[0])[0])
-
-    elems_ta = nest.map_structure(create_ta, elems)
-
-    if initializer is None:
-      a = nest.map_structure(lambda elem: elem.read(0), elems_ta)
-      i = constant_op.constant(1)
+    n = _get_leading_dim(elems_flat)
+    if parallel_iterations is None:
+      parallel_iterations = _default_parallel_iterations(
+          n, swap_memory, back_prop)
+
+    slice_specs = _slice_specs(elems, elems_flat)
+    if _should_unroll(
+        n, fn, (slice_specs if initializer is None else initializer,
+                slice_specs), unroll):
+      r_a = _fold_unrolled(fn, elems, elems_flat, n, initializer, back_prop)
     else:
-      a = initializer
-      i = constant_op.constant(0)
-
-    def compute(i, a):
-      elem_i = nest.map_structure(lambda elem: elem.read(i), elems_ta)
-      a = fn(a, elem_i)
-      return [i + 1, a]
+      if back_prop:
+        elems_ta = nest.pack_sequence_as(
+            elems, [create_ta(elem) for elem in elems_flat])
+      else:
+        elems_ta = nest.pack_sequence_as(
+            elems, [_GatherReader(elem) for elem in elems_flat])
 
-    _, r_a = control_flow_ops.while_loop(
-        lambda i, a: i < n,
-        compute, [i, a],
-        parallel_iterations=parallel_iterations,
-        back_prop=back_prop,
-        swap_memory=swap_memory,
-        maximum_iterations=n)
+      if initializer is None:
+        a = nest.map_structure(lambda elem: elem.read(0), elems_ta)
+        start = 1
+      else:
+        a = initializer
+        start = 0
+      i = constant_op.constant(start)
+
+      # Each iteration consumes chunk_size elements; the remaining
+      # (n - start) % chunk_size elements are folded in after the loop.
+      chunk_size = _get_chunk_size(chunk_size, n)
+      if chunk_size == 1:
+        loop_end = n
+        maximum_iterations = n
+      else:
+        maximum_iterations = (n - start) // chunk_size
+        loop_end = start + maximum_iterations * chunk_size
+      elems_ta_flat = nest.flatten(elems_ta)
+
+      def compute(i, a):
+        indices = _chunk_indices(i, chunk_size)
+        for elem_i in _read_chunk(elems_ta_flat, indices, chunk_size):
+          a = fn(a, nest.pack_sequence_as(elems_ta, elem_i))
+        return [i + chunk_size, a]
+
+      _, r_a = control_flow_ops.while_loop(
+          lambda i, a: i < loop_end,
+          compute, [i, a],
+          parallel_iterations=parallel_iterations,
+          back_prop=back_prop,
+          swap_memory=swap_memory and back_prop,
+          maximum_iterations=maximum_iterations)
+
+      if chunk_size > 1:
+        for j in range(loop_end, n):
+          elem_j = _read_chunk(elems_ta_flat, j, 1)[0]
+          r_a = fn(r_a, nest.pack_sequence_as(elems_ta, elem_j))
 
     # TODO(akshayka): Remove the in_graph_mode check once caching devices are
     # supported in Eager
@@ -173,10 +793,11 @@ results = tf.nest.map_structure(tf.stop_gradient, tf.foldl(fn, elems))""",
 def foldl_v2(fn,
              elems,
              initializer=None,
-             parallel_iterations=10,
+             parallel_iterations=None,
              back_prop=True,
              swap_memory=False,
-             name=None):
+             name=None,
+             unroll="auto"):
   """foldl on the list of tensors unpacked from `elems` on dimension 0.
 
   This foldl operator repeatedly applies the callable `fn` to a sequence
@@ -205,11 +826,23 @@ def foldl_v2(fn,
     initializer: (optional) A tensor or (possibly nested) sequence of tensors,
       as the initial value for the accumulator.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel.
+      parallel.  If None, it is chosen from the type of the device the loop is
+      placed on.
     back_prop: (optional) Deprecated. False disables support for back
       propagation. Prefer using `tf.stop_gradient` instead.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     name: (optional) Name prefix for the returned tensors.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements if `fn` creates no variables and no stateful
+      ops, which `fn` is traced once more to check.  Unrolled calls to `fn`
+      each create their own stateful ops, so that for example a seeded random
+      op in `fn` gives the same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors, resulting from applying
@@ -218,6 +851,7 @@ def foldl_v2(fn,
 
   Raises:
     TypeError: if `fn` is not callable.
+    ValueError: if `unroll` is not True, False or "auto".
 
   Example:
     ```python
@@ -233,17 +867,19 @@ def foldl_v2(fn,
       parallel_iterations=parallel_iterations,
       back_prop=back_prop,
       swap_memory=swap_memory,
-      name=name)
+      name=name,
+      unroll=unroll)
 
 
 @tf_export(v1=["foldr"])
 def foldr(fn,
           elems,
           initializer=None,
-          parallel_iterations=10,
+          parallel_iterations=None,
           back_prop=True,
           swap_memory=False,
-          name=None):
+          name=None,
+          unroll="auto"):
   """foldr on the list of tensors unpacked from `elems` on dimension 0.
 
   This foldr operator repeatedly applies the callable `fn` to a sequence
@@ -272,10 +908,22 @@ def foldr(fn,
     initializer: (optional) A tensor or (possibly nested) sequence of tensors,
       as the initial value for the accumulator.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel.
+      parallel.  If None, it is chosen from the type of the device the loop is
+      placed on.
     back_prop: (optional) True enables support for back propagation.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     name: (optional) Name prefix for the returned tensors.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements if `fn` creates no variables and no stateful
+      ops, which `fn` is traced once more to check.  Unrolled calls to `fn`
+      each create their own stateful ops, so that for example a seeded random
+      op in `fn` gives the same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors, resulting from applying
@@ -284,6 +932,7 @@ def foldr(fn,
 
   Raises:
     TypeError: if `fn` is not callable.
+    ValueError: if `unroll` is not True, False or "auto".
 
   Example:
     ```python
@@ -295,63 +944,20 @@ def foldr(fn,
   if not callable(fn):
     raise TypeError("fn must be callable.")
 
-  def create_ta(elem):
-    return tensor_array_ops.TensorArray(
-        dtype=elem.dtype, size=n, dynamic_size=False,
-        infer_shape=True).unstack(elem)
-
-  in_graph_mode = not context.executing_eagerly()
-  with ops.name_scope(name, "foldr", [elems]):
-    # TODO(akshayka): Remove the in_graph_mode check once caching devices are
-    # supported in Eager
-    if in_graph_mode:
-      # Any get_variable calls in fn will cache the first call locally and not
-      # issue repeated network I/O requests for each iteration.
-      varscope = vs.get_variable_scope()
-      varscope_caching_device_was_none = False
-      if varscope.caching_device is None:
-        # TODO(ebrevdo): Change to using colocate_with here and in other
-        # methods.
-        varscope.set_caching_device(lambda op: op.device)
-        varscope_caching_device_was_none = True
-
-    # Convert elems to tensor array. n may be known statically.
-    elems_flat = [
-        ops.convert_to_tensor(elem, name="elem") for elem in nest.flatten(elems)
-    ]
-    n = (
-        tensor_shape.dimension_value(elems_flat[0].shape[0]) or
-        array_ops.shape(elems_flat[0])[0])
-
-    elems_ta = nest.map_structure(create_ta, elems)
-
-    if initializer is None:
-      i = n - 1
-      a = nest.map_structure(lambda elem: elem.read(i), elems_ta)
-    else:
-      i = n
-      a = initializer
-
-    def compute(i, a):
-      i -= 1
-      elem = nest.map_structure(lambda elem: elem.read(i), elems_ta)
-      a_out = fn(a, elem)
-      return [i, a_out]
-
-    _, r_a = control_flow_ops.while_loop(
-        lambda i, a: i > 0,
-        compute, [i, a],
+  # Folding from the last element to the first is a foldl over the reversed
+  # elements, so the loop itself is built by foldl.
+  with ops.name_scope(name, "foldr", [elems]) as scope:
+    reversed_elems = nest.map_structure(
+        lambda elem: array_ops.reverse(elem, [0]), elems)
+    return foldl(
+        fn,
+        reversed_elems,
+        initializer=initializer,
         parallel_iterations=parallel_iterations,
         back_prop=back_prop,
         swap_memory=swap_memory,
-        maximum_iterations=n)
-
-    # TODO(akshayka): Remove the in_graph_mode check once caching devices are
-    # supported in Eager
-    if in_graph_mode and varscope_caching_device_was_none:
-      varscope.set_caching_device(None)
-
-    return r_a
+        name=scope,
+        unroll=unroll)
 
 
 @tf_export("foldr", v1=[])
@@ -367,10 +973,11 @@ results = tf.nest.map_structure(tf.stop_gradient, tf.foldr(fn, elems))""",
 def foldr_v2(fn,
              elems,
              initializer=None,
-             parallel_iterations=10,
+             parallel_iterations=None,
              back_prop=True,
              swap_memory=False,
-             name=None):
+             name=None,
+             unroll="auto"):
   """foldr on the list of tensors unpacked from `elems` on dimension 0.
 
   This foldr operator repeatedly applies the callable `fn` to a sequence
@@ -399,11 +1006,23 @@ def foldr_v2(fn,
     initializer: (optional) A tensor or (possibly nested) sequence of tensors,
       as the initial value for the accumulator.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel.
+      parallel.  If None, it is chosen from the type of the device the loop is
+      placed on.
     back_prop: (optional) Deprecated. False disables support for back
       propagation. Prefer using `tf.stop_gradient` instead.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     name: (optional) Name prefix for the returned tensors.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements if `fn` creates no variables and no stateful
+      ops, which `fn` is traced once more to check.  Unrolled calls to `fn`
+      each create their own stateful ops, so that for example a seeded random
+      op in `fn` gives the same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors, resulting from applying
@@ -412,6 +1031,7 @@ def foldr_v2(fn,
 
   Raises:
     TypeError: if `fn` is not callable.
+    ValueError: if `unroll` is not True, False or "auto".
 
   Example:
     ```python
@@ -427,19 +1047,22 @@ def foldr_v2(fn,
       parallel_iterations=parallel_iterations,
       back_prop=back_prop,
       swap_memory=swap_memory,
-      name=name)
+      name=name,
+      unroll=unroll)
 
 
 @tf_export(v1=["scan"])
 def scan(fn,
          elems,
          initializer=None,
-         parallel_iterations=10,
+         parallel_iterations=None,
          back_prop=True,
          swap_memory=False,
          infer_shape=True,
          reverse=False,
-         name=None):
+         name=None,
+         associative=False,
+         unroll="auto"):
   """scan on the list of tensors unpacked from `elems` on dimension 0.
 
   The simplest version of `scan` repeatedly applies the callable `fn` to a
@@ -467,6 +1090,15 @@ def scan(fn,
   structure as `initializer`; and the first argument of `fn` must match
   this structure.
 
+  If `associative` is True, `fn` is assumed to be associative and to operate
+  elementwise on a batch of values along their first dimension, for example
+  `fn = lambda a, x: a + x` or `fn = tf.maximum`.  The scan is then computed
+  with a parallel prefix scan that calls `fn` O(log(n)) times sequentially
+  on batches of values, instead of with a `while_loop` of `n` iterations.
+  The accumulator must have the same structure and dtypes as `elems`.  If the
+  size of the first dimension of `elems` is not known statically, the
+  sequential implementation is used.
+
   For example, if `elems` is `(t1, [t2, t3])` and `initializer` is
   `[i1, i2]` then an appropriate signature for `fn` in `python2` is:
   `fn = lambda (acc_p1, acc_p2), (t1, [t2, t3]):` and `fn` must return a list,
@@ -487,13 +1119,28 @@ def scan(fn,
     initializer: (optional) A tensor or (possibly nested) sequence of tensors,
       initial value for the accumulator, and the expected output type of `fn`.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel.
+      parallel.  If None, it is chosen from the type of the device the loop is
+      placed on.
     back_prop: (optional) True enables support for back propagation.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     infer_shape: (optional) False disables tests for consistent output shapes.
     reverse: (optional) True scans the tensor last to first (instead of first to
       last).
     name: (optional) Name prefix for the returned tensors.
+    associative: (optional) True asserts that `fn` is associative and
+      vectorized along the first dimension of its arguments, and enables the
+      parallel prefix scan described above.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements if `fn` creates no variables and no stateful
+      ops, which `fn` is traced once more to check.  Unrolled calls to `fn`
+      each create their own stateful ops, so that for example a seeded random
+      op in `fn` gives the same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors.  Each tensor packs the
@@ -505,7 +1152,9 @@ def scan(fn,
     TypeError: if `fn` is not callable or the structure of the output of
       `fn` and `initializer` do not match.
     ValueError: if the lengths of the output of `fn` and `initializer`
-      do not match.
+      do not match, if `associative` is True and `initializer` does not
+      have the same structure and dtypes as `elems`, or if `unroll` is not
+      True, False or "auto".
 
   Examples:
     ```python
@@ -531,8 +1180,41 @@ def scan(fn,
     # fibonaccis == ([1, 1, 2, 3, 5, 8], [1, 2, 3, 5, 8, 13])
     ```
   """
+  return _scan_impl(
+      fn=fn,
+      elems=elems,
+      initializer=initializer,
+      parallel_iterations=parallel_iterations,
+      back_prop=back_prop,
+      swap_memory=swap_memory,
+      infer_shape=infer_shape,
+      reverse=reverse,
+      name=name,
+      associative=associative,
+      unroll=unroll)
+
+
+def _scan_impl(fn,
+               elems,
+               initializer=None,
+               parallel_iterations=None,
+               back_prop=True,
+               swap_memory=False,
+               infer_shape=True,
+               reverse=False,
+               name=None,
+               associative=False,
+               unroll="auto",
+               chunk_size=1):
+  """Implements `scan`, scanning `chunk_size` elements per loop iteration.
+
+  Chunking trades a larger loop body for fewer loop iterations.  The leftover
+  elements are scanned after the loop.
+  """
   if not callable(fn):
     raise TypeError("fn must be callable.")
+  if unroll is not True and unroll is not False and unroll != "auto":
+    raise ValueError("unroll must be True, False or 'auto', got %r" % (unroll,))
 
   input_is_sequence = nest.is_sequence(elems)
   input_flatten = lambda x: nest.flatten(x) if input_is_sequence else [x]
@@ -575,92 +1257,227 @@ def scan(fn,
     ]
 
     # Convert elems to tensor array. n may be known statically.
-    n = tensor_shape.dimension_value(elems_flat[0].shape[0])
-    if n is None:
-      n = array_ops.shape(elems_flat[0])[0]
-
-    # TensorArrays are always flat
-    elems_ta = [
-        tensor_array_ops.TensorArray(
-            dtype=elem.dtype,
-            size=n,
-            dynamic_size=False,
-            element_shape=elem.shape[1:],
-            infer_shape=True) for elem in elems_flat
-    ]
-    # Unpack elements
-    elems_ta = [
-        elem_ta.unstack(elem) for elem_ta, elem in zip(elems_ta, elems_flat)
-    ]
-
-    if initializer is None:
-      a_flat = [elem.read(n - 1 if reverse else 0) for elem in elems_ta]
-      i = 1
+    n = _get_leading_dim(elems_flat)
+    if parallel_iterations is None:
+      parallel_iterations = _default_parallel_iterations(
+          n, swap_memory, back_prop)
+
+    slice_specs = _slice_specs(elems, elems_flat)
+    if associative and isinstance(n, int) and n > 0:
+      scan_elems_flat = elems_flat
+      if reverse:
+        scan_elems_flat = [
+            array_ops.reverse(elem, [0]) for elem in scan_elems_flat
+        ]
+      if initializer is not None:
+        try:
+          nest.assert_same_structure(elems, initializer)
+        except (ValueError, TypeError) as e:
+          raise ValueError(
+              "With associative=True, initializer must have the same "
+              "structure as elems: %s" % e)
+        initializer_flat = [
+            ops.convert_to_tensor(init, name="initializer")
+            for init in output_flatten(initializer)
+        ]
+        for init, elem in zip(initializer_flat, elems_flat):
+          if init.dtype != elem.dtype:
+            raise ValueError(
+                "With associative=True, initializer must have the same dtypes "
+                "as elems, but got an initializer of dtype %s for elems of "
+                "dtype %s." % (init.dtype.name, elem.dtype.name))
+        scan_elems_flat = [
+            array_ops.concat([array_ops.expand_dims(init, 0), elem], axis=0)
+            for init, elem in zip(initializer_flat, scan_elems_flat)
+        ]
+
+      def combine(a_flat, x_flat):
+        a_out = fn(output_pack(a_flat), output_pack(x_flat))
+        nest.assert_same_structure(
+            elems if initializer is None else initializer, a_out)
+        return output_flatten(a_out)
+
+      results_flat = _scan_associative(combine, scan_elems_flat,
+                                       n if initializer is None else n + 1)
+      if initializer is not None:
+        results_flat = [r[1:] for r in results_flat]
+      if reverse:
+        results_flat = [array_ops.reverse(r, [0]) for r in results_flat]
+      if not back_prop:
+        results_flat = [array_ops.stop_gradient(r) for r in results_flat]
+    elif _should_unroll(
+        n, fn, (slice_specs if initializer is None else initializer,
+                slice_specs), unroll):
+      rows = _unstack_rows(elems_flat, n)
+      if reverse:
+        rows.reverse()
+      if initializer is None:
+        a_flat = rows.pop(0)
+        outputs_flat = [a_flat]
+      else:
+        a_flat = [
+            ops.convert_to_tensor(init)
+            for init in output_flatten(initializer)
+        ]
+        outputs_flat = []
+      scope_counts = _variable_scope_counts()
+      for step, row in enumerate(rows):
+        with _unrolled_variable_scope(step, scope_counts):
+          a_out = fn(output_pack(a_flat), input_pack(row))
+        nest.assert_same_structure(
+            elems if initializer is None else initializer, a_out)
+        a_flat = output_flatten(a_out)
+        outputs_flat.append(a_flat)
+      if reverse:
+        outputs_flat.reverse()
+      results_flat = [array_ops.stack(r) for r in zip(*outputs_flat)]
+      if not back_prop:
+        results_flat = [array_ops.stop_gradient(r) for r in results_flat]
+    elif infer_shape and _use_dense_accumulators(n):
+      # Gather the elements and write the results into dense tensors, which
+      # XLA can fuse with the loop body, instead of using TensorArrays.
+      def read(index):
+        return [array_ops.gather(elem, index) for elem in elems_flat]
+
+      first = n - 1 if reverse else 0
+      if initializer is None:
+        a_flat = read(first)
+        i = 1
+      else:
+        a_flat = [
+            ops.convert_to_tensor(init)
+            for init in output_flatten(initializer)
+        ]
+        i = 0
+      accs = [_dense_accumulator(n, a) for a in a_flat]
+      if initializer is None:
+        accs = [_write_row(acc, first, a) for acc, a in zip(accs, a_flat)]
+
+      def compute(i, a_flat, accs):
+        index = n - 1 - i if reverse else i
+        a_out = fn(output_pack(a_flat), input_pack(read(index)))
+        nest.assert_same_structure(
+            elems if initializer is None else initializer, a_out)
+        a_flat = output_flatten(a_out)
+        accs = [_write_row(acc, index, a) for acc, a in zip(accs, a_flat)]
+        return (i + 1, a_flat, accs)
+
+      _, _, results_flat = control_flow_ops.while_loop(
+          lambda i, _1, _2: i < n,
+          compute, (i, a_flat, accs),
+          parallel_iterations=parallel_iterations,
+          back_prop=back_prop,
+          swap_memory=swap_memory and back_prop,
+          maximum_iterations=n - i)
     else:
-      initializer_flat = output_flatten(initializer)
-      a_flat = [ops.convert_to_tensor(init) for init in initializer_flat]
-      i = 0
-
-    # Create a tensor array to store the intermediate values.
-    accs_ta = [
-        tensor_array_ops.TensorArray(
-            dtype=init.dtype,
-            size=n,
-            element_shape=init.shape if infer_shape else None,
-            dynamic_size=False,
-            infer_shape=infer_shape) for init in a_flat
-    ]
+      # TensorArrays are always flat.  As in map_fn, each is colocated with
+      # its first write: elems_ta with elems and accs_ta with fn's output.
+      elems_ta = [
+          tensor_array_ops.TensorArray(
+              dtype=elem.dtype,
+              size=n,
+              dynamic_size=False,
+              element_shape=elem.shape[1:],
+              infer_shape=True) for elem in elems_flat
+      ]
+      # Unpack elements
+      elems_ta = [
+          elem_ta.unstack(elem) for elem_ta, elem in zip(elems_ta, elems_flat)
+      ]
+
+      if initializer is None:
+        a_flat = [elem.read(n - 1 if reverse else 0) for elem in elems_ta]
+        i = 1
+      else:
+        initializer_flat = output_flatten(initializer)
+        a_flat = [ops.convert_to_tensor(init) for init in initializer_flat]
+        i = 0
 
-    if initializer is None:
+      # Create a tensor array to store the intermediate values.
       accs_ta = [
-          acc_ta.write(n - 1 if reverse else 0, a)
-          for (acc_ta, a) in zip(accs_ta, a_flat)
+          tensor_array_ops.TensorArray(
+              dtype=init.dtype,
+              size=n,
+              element_shape=init.shape if infer_shape else None,
+              dynamic_size=False,
+              infer_shape=infer_shape) for init in a_flat
       ]
 
-    def compute(i, a_flat, tas):
-      """The loop body of scan.
-
-      Args:
-        i: the loop counter.
-        a_flat: the accumulator value(s), flattened.
-        tas: the output accumulator TensorArray(s), flattened.
-
-      Returns:
-        [i + 1, a_flat, tas]: the updated counter + new accumulator values +
-          updated TensorArrays
-
-      Raises:
-        TypeError: if initializer and fn() output structure do not match
-        ValueType: if initializer and fn() output lengths do not match
-      """
-      packed_elems = input_pack([elem_ta.read(i) for elem_ta in elems_ta])
-      packed_a = output_pack(a_flat)
-      a_out = fn(packed_a, packed_elems)
-      nest.assert_same_structure(elems if initializer is None else initializer,
-                                 a_out)
-      flat_a_out = output_flatten(a_out)
-      tas = [ta.write(i, value) for (ta, value) in zip(tas, flat_a_out)]
-      if reverse:
-        next_i = i - 1
+      if initializer is None:
+        accs_ta = [
+            acc_ta.write(n - 1 if reverse else 0, a)
+            for (acc_ta, a) in zip(accs_ta, a_flat)
+        ]
+
+      def step(elems_i, a_flat):
+        """Applies `fn` to a single element and the accumulator values."""
+        packed_elems = input_pack(elems_i)
+        packed_a = output_pack(a_flat)
+        a_out = fn(packed_a, packed_elems)
+        nest.assert_same_structure(
+            elems if initializer is None else initializer, a_out)
+        return output_flatten(a_out)
+
+      # Each iteration consumes chunk_size elements; the remaining
+      # (n - i) % chunk_size elements are scanned after the loop.
+      chunk_size = _get_chunk_size(chunk_size, n)
+      if chunk_size == 1:
+        maximum_iterations = n
+        loop_end = n
       else:
-        next_i = i + 1
-      return (next_i, flat_a_out, tas)
+        maximum_iterations = (n - i) // chunk_size
+        loop_end = i + maximum_iterations * chunk_size
+
+      def compute(i, a_flat, tas):
+        """The loop body of scan.
+
+        Args:
+          i: the loop counter.
+          a_flat: the accumulator value(s), flattened.
+          tas: the output accumulator TensorArray(s), flattened.
+
+        Returns:
+          [i + chunk_size, a_flat, tas]: the updated counter + new accumulator
+            values + updated TensorArrays
+
+        Raises:
+          TypeError: if initializer and fn() output structure do not match
+          ValueType: if initializer and fn() output lengths do not match
+        """
+        indices = _chunk_indices(i, chunk_size, reverse=reverse)
+        outputs_flat = []
+        for elems_j in _read_chunk(elems_ta, indices, chunk_size):
+          a_flat = step(elems_j, a_flat)
+          outputs_flat.append(a_flat)
+        tas = _write_chunk(tas, indices, outputs_flat)
+        if reverse:
+          next_i = i - chunk_size
+        else:
+          next_i = i + chunk_size
+        return (next_i, a_flat, tas)
 
-    if reverse:
-      initial_i = n - 1 - i
-      condition = lambda i, _1, _2: i >= 0
-    else:
-      initial_i = i
-      condition = lambda i, _1, _2: i < n
-    _, _, r_a = control_flow_ops.while_loop(
-        condition,
-        compute, (initial_i, a_flat, accs_ta),
-        parallel_iterations=parallel_iterations,
-        back_prop=back_prop,
-        swap_memory=swap_memory,
-        maximum_iterations=n)
-
-    results_flat = [r.stack() for r in r_a]
+      if reverse:
+        initial_i = n - 1 - i
+        loop_stop = n - loop_end if chunk_size > 1 else 0
+        condition = lambda i, _1, _2: i >= loop_stop
+        tail_indices = range(loop_stop - 1, -1, -1) if chunk_size > 1 else []
+      else:
+        initial_i = i
+        condition = lambda i, _1, _2: i < loop_end
+        tail_indices = range(loop_end, n) if chunk_size > 1 else []
+      _, r_flat, r_a = control_flow_ops.while_loop(
+          condition,
+          compute, (initial_i, a_flat, accs_ta),
+          parallel_iterations=parallel_iterations,
+          back_prop=back_prop,
+          swap_memory=swap_memory and back_prop,
+          maximum_iterations=maximum_iterations)
+
+      for index in tail_indices:
+        r_flat = step(_read_chunk(elems_ta, index, 1)[0], r_flat)
+        r_a = _write_chunk(r_a, index, [r_flat])
+
+      results_flat = [r.stack() for r in r_a]
 
     n_static = tensor_shape.Dimension(
         tensor_shape.dimension_value(
@@ -695,12 +1512,14 @@ results = tf.nest.map_structure(tf.stop_gradient, tf.scan(fn, elems))""",
 def scan_v2(fn,
             elems,
             initializer=None,
-            parallel_iterations=10,
+            parallel_iterations=None,
             back_prop=True,
             swap_memory=False,
             infer_shape=True,
             reverse=False,
-            name=None):
+            name=None,
+            associative=False,
+            unroll="auto"):
   """scan on the list of tensors unpacked from `elems` on dimension 0.
 
   The simplest version of `scan` repeatedly applies the callable `fn` to a
@@ -728,6 +1547,15 @@ def scan_v2(fn,
   structure as `initializer`; and the first argument of `fn` must match
   this structure.
 
+  If `associative` is True, `fn` is assumed to be associative and to operate
+  elementwise on a batch of values along their first dimension, for example
+  `fn = lambda a, x: a + x` or `fn = tf.maximum`.  The scan is then computed
+  with a parallel prefix scan that calls `fn` O(log(n)) times sequentially
+  on batches of values, instead of with a `while_loop` of `n` iterations.
+  The accumulator must have the same structure and dtypes as `elems`.  If the
+  size of the first dimension of `elems` is not known statically, the
+  sequential implementation is used.
+
   For example, if `elems` is `(t1, [t2, t3])` and `initializer` is
   `[i1, i2]` then an appropriate signature for `fn` in `python2` is:
   `fn = lambda (acc_p1, acc_p2), (t1, [t2, t3]):` and `fn` must return a list,
@@ -748,14 +1576,29 @@ def scan_v2(fn,
     initializer: (optional) A tensor or (possibly nested) sequence of tensors,
       initial value for the accumulator, and the expected output type of `fn`.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel.
+      parallel.  If None, it is chosen from the type of the device the loop is
+      placed on.
     back_prop: (optional) Deprecated. False disables support for back
       propagation. Prefer using `tf.stop_gradient` instead.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     infer_shape: (optional) False disables tests for consistent output shapes.
     reverse: (optional) True scans the tensor last to first (instead of first to
       last).
     name: (optional) Name prefix for the returned tensors.
+    associative: (optional) True asserts that `fn` is associative and
+      vectorized along the first dimension of its arguments, and enables the
+      parallel prefix scan described above.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements if `fn` creates no variables and no stateful
+      ops, which `fn` is traced once more to check.  Unrolled calls to `fn`
+      each create their own stateful ops, so that for example a seeded random
+      op in `fn` gives the same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors.  Each tensor packs the
@@ -767,7 +1610,9 @@ def scan_v2(fn,
     TypeError: if `fn` is not callable or the structure of the output of
       `fn` and `initializer` do not match.
     ValueError: if the lengths of the output of `fn` and `initializer`
-      do not match.
+      do not match, if `associative` is True and `initializer` does not
+      have the same structure and dtypes as `elems`, or if `unroll` is not
+      True, False or "auto".
 
   Examples:
     ```python
@@ -802,7 +1647,9 @@ def scan_v2(fn,
       swap_memory=swap_memory,
       infer_shape=infer_shape,
       reverse=reverse,
-      name=name)
+      name=name,
+      associative=associative,
+      unroll=unroll)
 
 
 # pylint: disable=invalid-name
@@ -19,25 +19,370 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import threading
+import time
 
 from tensorflow.python.eager import context
 from tensorflow.python.framework import constant_op
+from tensorflow.python.framework import dtypes
 from tensorflow.python.framework import ops
 from tensorflow.python.framework import sparse_tensor
 from tensorflow.python.framework import tensor_shape
+from tensorflow.python.framework import tensor_spec
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import control_flow_ops
+from tensorflow.python.ops import functional_ops
+from tensorflow.python.ops import script_ops
 from tensorflow.python.ops import tensor_array_ops
 from tensorflow.python.ops import variable_scope as vs
 from tensorflow.python.platform import tf_logging as logging
 from tensorflow.python.util import deprecation
 from tensorflow.python.util import nest
+from tensorflow.python.util.lazy_loader import LazyLoader
 from tensorflow.python.util.tf_export import tf_export
 
+# This is to avoid a circular dependency:
+# parallel_for.control_flow_ops -> parallel_for.pfor -> map_fn
+parallel_for_ops = LazyLoader(
+    "parallel_for_ops", globals(),
+    "tensorflow.python.ops.parallel_for.control_flow_ops")
+
+
+# Ops that compute each element of their output from the corresponding elements
+# of their inputs, so that applying them to a stack of slices is the same as
+# stacking their results on each slice.
+_ELEMENTWISE_OPS = frozenset([
+    "Abs", "Add", "AddN", "AddV2", "Cast", "Ceil", "Cos", "Div", "DivNoNan",
+    "Elu", "Equal", "Erf", "Exp", "Expm1", "Floor", "FloorDiv", "FloorMod",
+    "Greater", "GreaterEqual", "Identity", "Less", "LessEqual", "Log",
+    "Log1p", "LogicalAnd", "LogicalNot", "LogicalOr", "Maximum", "Minimum",
+    "Mul", "Neg", "NotEqual", "Pow", "RealDiv", "Reciprocal", "Relu", "Relu6",
+    "Round", "Rsqrt", "Select", "SelectV2", "Selu", "Sigmoid", "Sign", "Sin",
+    "Softplus", "Softsign", "Sqrt", "Square", "SquaredDifference", "Sub",
+    "Tan", "Tanh",
+])
+
+
+def _depends_on(tensor, source):
+  """Returns True if `tensor` is computed from `source`."""
+  visited = set()
+  pending = [tensor]
+  while pending:
+    t = pending.pop()
+    if t is source:
+      return True
+    if t.op in visited:
+      continue
+    visited.add(t.op)
+    pending.extend(t.op.inputs)
+  return False
+
+
+def _same_ops(graph, arg, other_graph, other_arg):
+  """Returns True if two traces of a function created the same ops.
+
+  Args:
+    graph: The graph of the first trace.
+    arg: The placeholder passed to the function in `graph`.
+    other_graph: The graph of the second trace.
+    other_arg: The placeholder passed to the function in `other_graph`.
+
+  Returns:
+    True if the ops in both graphs have the same types, attributes (including
+    the values of constants) and inputs, apart from the shapes of `arg` and
+    `other_arg`.
+  """
+  ops_list = graph.get_operations()
+  other_ops_list = other_graph.get_operations()
+  if len(ops_list) != len(other_ops_list):
+    return False
+  index = {op: i for i, op in enumerate(ops_list)}
+  other_index = {op: i for i, op in enumerate(other_ops_list)}
+  for op, other_op in zip(ops_list, other_ops_list):
+    if (op is arg.op) != (other_op is other_arg.op):
+      return False
+    if op is arg.op:
+      continue
+    attrs = op.node_def.attr
+    other_attrs = other_op.node_def.attr
+    if (op.type != other_op.type or sorted(attrs) != sorted(other_attrs) or
+        any(attrs[key] != other_attrs[key] for key in attrs)):
+      return False
+    inputs = [(index[t.op], t.value_index) for t in op.inputs]
+    other_inputs = [(other_index[t.op], t.value_index)
+                    for t in other_op.inputs]
+    if inputs != other_inputs:
+      return False
+  return True
+
+
+def _check_elementwise(fn, elem, dtype):
+  """Traces `fn` on a slice of `elem` and checks that it is elementwise.
+
+  `fn` is called on a placeholder with the shape of a slice of `elem` in a
+  temporary graph.  It is elementwise if all the ops it creates are in
+  `_ELEMENTWISE_OPS` or are scalar constants, and its output is a single tensor
+  of `dtype` computed from the placeholder with the same shape.  `fn` is then
+  called on a placeholder with the shape of all of `elem`, which must create
+  the same ops: Python code in `fn` that depends on the static shape of its
+  argument may otherwise compute something else when given all the elements.
+  Calling an elementwise `fn` directly on `elem` broadcasts it over the first
+  dimension.
+
+  Args:
+    fn: The callable passed to `map_fn`.
+    elem: The tensor being mapped over.
+    dtype: The expected output dtype of `fn`.
+
+  Raises:
+    functional_ops._TraceRejected: if `fn` is not elementwise.
+  """
+  # pylint: disable=protected-access
+  probe_graph, (value,), output = functional_ops._trace_isolated(
+      fn, [(elem.dtype, elem.shape[1:])], "map_fn_elementwise_probe")
+  if not isinstance(output, ops.Tensor) or output.graph is not probe_graph:
+    raise functional_ops._TraceRejected("fn does not return a single tensor")
+  if (output.dtype != dtype or
+      not output.shape.is_compatible_with(value.shape)):
+    raise functional_ops._TraceRejected(
+        "fn changes the dtype or shape of its input")
+  for op in probe_graph.get_operations():
+    if op is value.op or op.type in _ELEMENTWISE_OPS:
+      continue
+    if op.type == "Const" and op.outputs[0].shape.rank == 0:
+      continue
+    raise functional_ops._TraceRejected("fn uses op %s" % op.type)
+  if not _depends_on(output, value):
+    raise functional_ops._TraceRejected("fn does not depend on its input")
+
+  full_graph, (full_value,), full_output = functional_ops._trace_isolated(
+      fn, [(elem.dtype, elem.shape)], "map_fn_elementwise_probe")
+  if (not isinstance(full_output, ops.Tensor) or
+      full_output.graph is not full_graph or
+      not _same_ops(probe_graph, value, full_graph, full_value) or
+      full_graph.get_operations().index(full_output.op) !=
+      probe_graph.get_operations().index(output.op) or
+      full_output.value_index != output.value_index):
+    raise functional_ops._TraceRejected(
+        "fn does something else when given all the elements")
+  # pylint: enable=protected-access
+
+
+def _result_to_tensor(value, dtype):
+  """Converts an output of `fn` to a tensor of the `dtype` given to `map_fn`.
+
+  Args:
+    value: An output of `fn`.
+    dtype: The expected dtype of `value`.
+
+  Returns:
+    `value` as a tensor.
+
+  Raises:
+    TypeError: if `value` does not have dtype `dtype`.
+  """
+  value = ops.convert_to_tensor(value, preferred_dtype=dtype)
+  if value.dtype != dtype:
+    raise TypeError("fn returned a %s tensor where dtype specifies %s" %
+                    (value.dtype, dtype))
+  return value
+
+
+class _IterationProfiler(object):
+  """Times the calls to `fn` in a `map_fn` loop for `profile_iterations`.
+
+  Each timed call is bracketed by `py_func`s recording its start and end
+  time.  When the loop finishes, the mean time per call is logged together
+  with a hint on whether it is dominated by launching the ops in `fn` or by
+  the computation they do.
+  """
+
+  # Mean times per call below this are dominated by launch overhead.
+  _LAUNCH_BOUND_SECONDS = 1e-4
+  # Mean times per call above this are dominated by computation.
+  _COMPUTE_BOUND_SECONDS = 1e-3
+
+  def __init__(self, name):
+    self._name = name
+    self._lock = threading.Lock()
+    self._next_token = 0
+    self._start_times = {}
+    self._durations = []
+
+  def _start(self):
+    with self._lock:
+      token = self._next_token
+      self._next_token += 1
+      self._start_times[token] = time.time()
+    return token
+
+  def _end(self, token):
+    end_time = time.time()
+    with self._lock:
+      self._durations.append(end_time - self._start_times.pop(int(token)))
+    return token
+
+  def _report(self):
+    with self._lock:
+      durations, self._durations = self._durations, []
+    if durations:
+      mean = sum(durations) / len(durations)
+      if mean < self._LAUNCH_BOUND_SECONDS:
+        hint = ("launching the ops in fn probably dominates; consider "
+                "use_vectorized_map=True")
+      elif mean > self._COMPUTE_BOUND_SECONDS:
+        hint = "the ops in fn dominate; consider compiling them with XLA"
+      else:
+        hint = "neither launch overhead nor computation clearly dominates"
+      logging.info("map_fn %s: %d iterations took %.1fus on average: %s",
+                   self._name, len(durations), mean * 1e6, hint)
+    return 0
+
+  def time(self, step):
+    """Returns `step` with its computation timed."""
+
+    def timed_step(elems_i):
+      token = script_ops.py_func(self._start, [], dtypes.int64)
+      with ops.control_dependencies([token]):
+        outputs = step(elems_i)
+      with ops.control_dependencies(outputs):
+        token = script_ops.py_func(self._end, [token], dtypes.int64)
+      with ops.control_dependencies([token]):
+        return [array_ops.identity(output) for output in outputs]
+
+    return timed_step
+
+  def report_after(self, results):
+    """Returns `results`, logging the iteration times once they are ready."""
+    with ops.control_dependencies(results):
+      report = script_ops.py_func(self._report, [], dtypes.int64)
+    with ops.control_dependencies([report]):
+      return [array_ops.identity(result) for result in results]
+
+
+def _vectorized_map(fn, elems, dtype, input_signature, name):
+  """Maps `fn` over `elems` with `vectorized_map` if `fn` can be vectorized.
+
+  When graph building, an elementwise `fn` over a single tensor is applied to
+  all of `elems` at once, without `vectorized_map`.  Otherwise `fn` is first
+  vectorized in a throwaway graph, so that a failed attempt leaves no ops in
+  the calling graph.  This is not possible if `fn` creates variables.  Those
+  are then created by the attempt in the calling graph, and the `fn`
+  returned for the `while_loop` reuses them.
+
+  Args:
+    fn: The callable passed to `map_fn`.
+    elems: The (possibly nested) elems passed to `map_fn`.
+    dtype: The `dtype` passed to `map_fn`, or None.
+    input_signature: The `input_signature` passed to `map_fn`, or None.
+    name: The name passed to `map_fn`.
+
+  Returns:
+    A pair `(results, fn)` of the results computed without a loop, or None if
+    `fn` cannot be vectorized, and the callable to use instead of `fn` for
+    the `while_loop`.
+
+  Raises:
+    ValueError: if `input_signature` does not match `elems`.
+  """
+  # pylint: disable=protected-access
+  with ops.name_scope(name, "map", nest.flatten(elems)):
+    elems_flat = [
+        ops.convert_to_tensor(elem, name="elem")
+        for elem in nest.flatten(elems)]
+    if input_signature is not None:
+      _check_input_signature(elems, elems_flat, input_signature)
+    elems = nest.pack_sequence_as(elems, elems_flat)
+    fn_name = getattr(fn, "__name__", fn)
+
+    if context.executing_eagerly():
+      try:
+        return parallel_for_ops.vectorized_map(fn, elems), fn
+      except ValueError as e:
+        logging.warning("Using a while_loop for converting %s: %s", fn_name, e)
+        return None, fn
+
+    if not nest.is_sequence(elems) and not nest.is_sequence(dtype):
+      try:
+        _check_elementwise(fn, elems_flat[0], dtype or elems_flat[0].dtype)
+      except functional_ops._TraceRejected as e:
+        logging.vlog(1, "Not applying %s to all elements at once: %s",
+                     fn_name, e)
+      else:
+        # fn only uses elementwise ops, which already broadcast over the
+        # first dimension, so it can be applied to all the elements at once.
+        return fn(elems_flat[0]), fn
+
+    def vectorize(*args):
+      return parallel_for_ops.vectorized_map(
+          fn, nest.pack_sequence_as(elems, list(args)))
+
+    try:
+      functional_ops._trace_isolated(
+          vectorize, [(elem.dtype, elem.shape) for elem in elems_flat],
+          "map_fn_vectorize_probe")
+    except functional_ops._VariableCreationRejected:
+      pass
+    except functional_ops._TraceRejected as e:
+      logging.warning("Using a while_loop for converting %s: %s", fn_name, e)
+      return None, fn
+    else:
+      return parallel_for_ops.vectorized_map(fn, elems), fn
+
+    varscope = vs.get_variable_scope()
+    scope_store = vs.get_variable_scope_store()
+    scope_counts = dict(scope_store.variable_scopes_count)
+    try:
+      return parallel_for_ops.vectorized_map(fn, elems), fn
+    except ValueError as e:
+      logging.warning("Using a while_loop for converting %s: %s", fn_name, e)
+  # pylint: enable=protected-access
+
+  # Name the variable scopes opened by the while_loop like those opened by
+  # the failed attempt, and reuse the variables created in them.
+  scope_store.variable_scopes_count = scope_counts
+  original_fn = fn
+
+  def reuse_variables_fn(packed_values):
+    with vs.variable_scope(
+        varscope, reuse=vs.AUTO_REUSE, auxiliary_name_scope=False):
+      return original_fn(packed_values)
+
+  return None, reuse_variables_fn
+
+
+def _check_input_signature(elems, elems_flat, input_signature):
+  """Checks the slices of `elems` against the `input_signature` of `map_fn`.
+
+  Args:
+    elems: The (possibly nested) elems passed to `map_fn`.
+    elems_flat: The flattened `elems`, converted to tensors.
+    input_signature: A `tf.TensorSpec` or (possibly nested) structure of
+      `tf.TensorSpec`s matching `elems`, describing one slice of it.
+
+  Returns:
+    A list of `(dtype, shape)` pairs taken from the flattened signature.
+
+  Raises:
+    ValueError: if a slice of `elems` does not match its `tf.TensorSpec`.
+  """
+  nest.assert_same_structure(elems, input_signature)
+  arg_specs = []
+  for elem, spec in zip(elems_flat, nest.flatten(input_signature)):
+    if (elem.dtype != spec.dtype or
+        not spec.shape.is_compatible_with(elem.shape[1:])):
+      raise ValueError(
+          "Slices of elems with dtype %s and shape %s do not match "
+          "input_signature %s" % (elem.dtype, elem.shape[1:], spec))
+    arg_specs.append((spec.dtype, spec.shape))
+  return arg_specs
+
 
 @tf_export(v1=["map_fn"])
 def map_fn(fn, elems, dtype=None, parallel_iterations=None, back_prop=True,
-           swap_memory=False, infer_shape=True, name=None):
+           swap_memory=False, infer_shape=True, name=None,
+           use_vectorized_map=False, input_signature=None,
+           profile_iterations=False, unroll="auto"):
   """map on the list of tensors unpacked from `elems` on dimension 0.
 
   The simplest version of `map_fn` repeatedly applies the callable `fn` to a
@@ -109,12 +454,47 @@ def map_fn(fn, elems, dtype=None, parallel_iterations=None, back_prop=True,
       of Tensors differing from the structure of `elems`, then `dtype` is not
       optional and must have the same structure as the output of `fn`.
     parallel_iterations: (optional) The number of iterations allowed to run
-      in parallel. When graph building, the default value is 10. While executing
-      eagerly, the default value is set to 1.
+      in parallel. When graph building, the default value is chosen from the
+      type of the device the loop is placed on. While executing eagerly, the
+      default value is set to 1.
     back_prop: (optional) True enables support for back propagation.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     infer_shape: (optional) False disables tests for consistent output shapes.
     name: (optional) Name prefix for the returned tensors.
+    use_vectorized_map: (optional) True attempts to vectorize `fn` across the
+      first dimension of `elems` with `tf.vectorized_map`, replacing the loop
+      with batched ops.  If some op in `fn` cannot be vectorized, a warning is
+      logged and the regular `while_loop` based implementation is used.  The
+      results are checked against `dtype` and `elems` against
+      `input_signature`, and `unroll` must not be set.  When graph building,
+      if `elems` is a single tensor and `fn` is built only from elementwise
+      ops (such as `tf.add`, `tf.exp` or `tf.nn.relu`) on its argument and
+      scalar constants, `fn` is applied to all of `elems` at once instead.
+      `fn` is traced twice more on placeholders to make this check.
+    input_signature: (optional) A `tf.TensorSpec`, or a (possibly nested)
+      structure of them matching `elems`, describing the argument of `fn`.
+      When graph building with `back_prop` False, `fn` is traced once into a
+      function specialized to this signature.  If `fn` is a Python function
+      without a closure taking and returning a single tensor, later calls
+      with the same `fn` in the same graph reuse that function instead of
+      calling `fn` again, so they do not see changes to Python state that
+      `fn` reads.
+    profile_iterations: (optional) True times each call to `fn` in the loop
+      and logs the mean time per call when the loop finishes, with a hint on
+      whether launch overhead or computation dominates.  This always builds a
+      `while_loop`, and the timers add overhead of their own.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements, or up to 64 on GPU when `back_prop` is False,
+      if `fn` creates no variables and no stateful ops, which `fn` is traced
+      once more to check.  Unrolled calls to `fn` each create their own
+      stateful ops, so that for example a seeded random op in `fn` gives the
+      same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors.  Each tensor packs the
@@ -124,7 +504,9 @@ def map_fn(fn, elems, dtype=None, parallel_iterations=None, back_prop=True,
   Raises:
     TypeError: if `fn` is not callable or the structure of the output of
       `fn` and `dtype` do not match, or if elems is a SparseTensor.
-    ValueError: if the lengths of the output of `fn` and `dtype` do not match.
+    ValueError: if the lengths of the output of `fn` and `dtype` do not match,
+      if `input_signature` does not match `elems`, or if `unroll` is not
+      True, False or "auto" or is set together with `use_vectorized_map`.
 
   Examples:
     ```python
@@ -146,6 +528,30 @@ def map_fn(fn, elems, dtype=None, parallel_iterations=None, back_prop=True,
     # alternates[1] == [-1, -2, -3]
     ```
   """
+  return _map_fn_impl(
+      fn=fn,
+      elems=elems,
+      dtype=dtype,
+      parallel_iterations=parallel_iterations,
+      back_prop=back_prop,
+      swap_memory=swap_memory,
+      infer_shape=infer_shape,
+      name=name,
+      use_vectorized_map=use_vectorized_map,
+      input_signature=input_signature,
+      profile_iterations=profile_iterations,
+      unroll=unroll)
+
+
+def _map_fn_impl(fn, elems, dtype=None, parallel_iterations=None,
+                 back_prop=True, swap_memory=False, infer_shape=True,
+                 name=None, use_vectorized_map=False, input_signature=None,
+                 profile_iterations=False, unroll="auto", chunk_size=1):
+  """Implements `map_fn`, mapping `chunk_size` elements per loop iteration.
+
+  Chunking trades a larger loop body for fewer loop iterations.  The leftover
+  elements are mapped after the loop.
+  """
   if not callable(fn):
     raise TypeError("fn must be callable.")
 
@@ -156,11 +562,27 @@ def map_fn(fn, elems, dtype=None, parallel_iterations=None, back_prop=True,
         " SparseTensor(input.indices, map_fn(fn, input.values), "
         "input.dense_shape)")
 
+  if unroll is not True and unroll is not False and unroll != "auto":
+    raise ValueError("unroll must be True, False or 'auto', got %r" % (unroll,))
+
+  if use_vectorized_map and unroll != "auto":
+    raise ValueError("unroll cannot be set with use_vectorized_map")
+
+  if use_vectorized_map and not profile_iterations:
+    results, fn = _vectorized_map(fn, elems, dtype, input_signature, name)
+    if results is not None:
+      if dtype is not None:
+        nest.assert_same_structure(dtype, results)
+        for dt, result in zip(nest.flatten(dtype), nest.flatten(results)):
+          _result_to_tensor(result, dt)
+      if not back_prop:
+        results = nest.map_structure(array_ops.stop_gradient, results)
+      return results
+
   in_graph_mode = not context.executing_eagerly()
   # Set the default number of parallel_iterations depending on graph/eager mode.
-  if in_graph_mode and not parallel_iterations:
-    parallel_iterations = 10
-  elif not in_graph_mode and not parallel_iterations:
+  # When graph building it is chosen once the loop's device and size are known.
+  if not in_graph_mode and not parallel_iterations:
     parallel_iterations = 1
 
   if not in_graph_mode and parallel_iterations > 1:
@@ -218,57 +640,182 @@ def map_fn(fn, elems, dtype=None, parallel_iterations=None, back_prop=True,
         raise ValueError(
             "elements in elems must be 1+ dimensional Tensors, not scalars"
         )
-    n = (tensor_shape.dimension_value(static_shape[0])
-         or array_ops.shape(elems_flat[0])[0])
-
-    # TensorArrays are always flat
-    elems_ta = [
-        tensor_array_ops.TensorArray(dtype=elem.dtype,
-                                     size=n,
-                                     dynamic_size=False,
-                                     infer_shape=True)
-        for elem in elems_flat]
-    # Unpack elements
-    elems_ta = [
-        elem_ta.unstack(elem) for elem_ta, elem in zip(elems_ta, elems_flat)]
-
-    i = constant_op.constant(0)
-
-    accs_ta = [
-        tensor_array_ops.TensorArray(dtype=dt,
-                                     size=n,
-                                     dynamic_size=False,
-                                     infer_shape=infer_shape)
-        for dt in dtype_flat]
-
-    def compute(i, tas):
-      """The loop body of map_fn.
-
-      Args:
-        i: the loop counter
-        tas: the flat TensorArray accumulator list
-
-      Returns:
-        (i + 1, tas): the updated counter + updated TensorArrays
-
-      Raises:
-        TypeError: if dtype and packed_fn_values structure do not match
-        ValueType: if dtype and packed_fn_values lengths do not match
-      """
-      packed_values = input_pack([elem_ta.read(i) for elem_ta in elems_ta])
-      packed_fn_values = fn(packed_values)
-      nest.assert_same_structure(dtype or elems, packed_fn_values)
-      flat_fn_values = output_flatten(packed_fn_values)
-      tas = [ta.write(i, value) for (ta, value) in zip(tas, flat_fn_values)]
-      return (i + 1, tas)
-
-    _, r_a = control_flow_ops.while_loop(
-        lambda i, _: i < n, compute, (i, accs_ta),
-        parallel_iterations=parallel_iterations,
-        back_prop=back_prop,
-        swap_memory=swap_memory,
-        maximum_iterations=n)
-    results_flat = [r.stack() for r in r_a]
+    # pylint: disable=protected-access
+    n = functional_ops._get_leading_dim(elems_flat)
+    if not parallel_iterations:
+      parallel_iterations = functional_ops._default_parallel_iterations(
+          n, swap_memory, back_prop)
+    arg_specs = [(elem.dtype, elem.shape[1:]) for elem in elems_flat]
+
+    if input_signature is not None:
+      arg_specs = _check_input_signature(elems, elems_flat, input_signature)
+      # The gradient of a Defun is computed with SymbolicGradient, which does
+      # not support every op fn may use, so fn is only traced into one when
+      # building a loop without back propagation.
+      if in_graph_mode and not back_prop:
+        # Functions with a single input and output are shared between calls.
+        # The cached Defun must not refer to this call's elems, whose graph
+        # is the key of the cache.
+        fn_cache = None
+        if not input_is_sequence and not output_is_sequence:
+          fn_cache = functional_ops._get_fn_cache(fn, arg_specs)
+        if fn_cache is None:
+          fn_cache = {}
+        if "signature_defun" not in fn_cache:
+          flat_fn = fn
+          if input_is_sequence or output_is_sequence:
+            original_fn = fn
+
+            def flat_fn(*args):  # pylint: disable=function-redefined
+              return output_flatten(original_fn(input_pack(list(args))))
+
+          fn_cache["signature_defun"] = functional_ops._make_defun(
+              flat_fn, arg_specs)
+        signature_defun = fn_cache["signature_defun"]
+
+        def fn(packed_values):  # pylint: disable=function-redefined
+          return output_pack(
+              nest.flatten(signature_defun(*input_flatten(packed_values))))
+
+    slice_specs = input_pack(
+        [tensor_spec.TensorSpec(shape, dtype) for dtype, shape in arg_specs])
+
+    if not profile_iterations and functional_ops._should_unroll(
+        n, fn, (slice_specs,), unroll, back_prop):
+      outputs_flat = []
+      rows = functional_ops._unstack_rows(elems_flat, n)
+      scope_counts = functional_ops._variable_scope_counts()
+      for step, row in enumerate(rows):
+        with functional_ops._unrolled_variable_scope(step, scope_counts):
+          packed_fn_values = fn(input_pack(row))
+        nest.assert_same_structure(dtype or elems, packed_fn_values)
+        outputs_flat.append(output_flatten(packed_fn_values))
+      results_flat = [
+          array_ops.stack([_result_to_tensor(v, dt) for v in r])
+          for dt, r in zip(dtype_flat, zip(*outputs_flat))]
+      if not back_prop:
+        results_flat = [array_ops.stop_gradient(r) for r in results_flat]
+    elif (infer_shape and not profile_iterations and
+          functional_ops._use_dense_accumulators(n) and
+          functional_ops._is_stateless(fn, (slice_specs,))):
+      # Gather the elements and write the results into dense tensors, which
+      # XLA can fuse with the loop body, instead of using TensorArrays.  The
+      # first element is mapped before the loop to find the result shapes,
+      # so fn must not have stateful ops, which would be copied.
+      def step(i):
+        packed_values = input_pack(
+            [array_ops.gather(elem, i) for elem in elems_flat])
+        packed_fn_values = fn(packed_values)
+        nest.assert_same_structure(dtype or elems, packed_fn_values)
+        return [
+            _result_to_tensor(v, dt)
+            for dt, v in zip(dtype_flat, output_flatten(packed_fn_values))]
+
+      scope_counts = functional_ops._variable_scope_counts()
+      first_flat = step(0)
+      accs = [
+          functional_ops._write_row(
+              functional_ops._dense_accumulator(n, r), 0, r)
+          for r in first_flat]
+
+      def compute(i, accs):
+        with functional_ops._unrolled_variable_scope(1, scope_counts):
+          outputs_flat = step(i)
+        return (i + 1, [functional_ops._write_row(acc, i, r)
+                        for acc, r in zip(accs, outputs_flat)])
+
+      _, results_flat = control_flow_ops.while_loop(
+          lambda i, _: i < n,
+          compute, (1, accs),
+          parallel_iterations=parallel_iterations,
+          back_prop=back_prop,
+          swap_memory=swap_memory and back_prop,
+          maximum_iterations=n - 1)
+      if not back_prop:
+        results_flat = [array_ops.stop_gradient(r) for r in results_flat]
+    else:
+      # TensorArrays are always flat.  They are colocated with their first
+      # write (colocate_with_first_write_call defaults to True), so elems_ta
+      # is placed with elems and accs_ta with the outputs of fn; reads and
+      # writes in the loop do not copy between devices.
+      elems_ta = [
+          tensor_array_ops.TensorArray(dtype=elem.dtype,
+                                       size=n,
+                                       dynamic_size=False,
+                                       element_shape=elem.shape[1:],
+                                       infer_shape=True)
+          for elem in elems_flat]
+      # Unpack elements
+      elems_ta = [
+          elem_ta.unstack(elem) for elem_ta, elem in zip(elems_ta, elems_flat)]
+
+      i = constant_op.constant(0)
+
+      accs_ta = [
+          tensor_array_ops.TensorArray(dtype=dt,
+                                       size=n,
+                                       dynamic_size=False,
+                                       infer_shape=infer_shape)
+          for dt in dtype_flat]
+
+      def step(elems_i):
+        """Applies `fn` to a single element and returns its flat output."""
+        packed_values = input_pack(elems_i)
+        packed_fn_values = fn(packed_values)
+        nest.assert_same_structure(dtype or elems, packed_fn_values)
+        return output_flatten(packed_fn_values)
+
+      if profile_iterations:
+        profiler = _IterationProfiler(ops.get_name_scope())
+        step = profiler.time(step)
+
+      # Each iteration consumes chunk_size elements; the remaining
+      # n % chunk_size elements are mapped after the loop.
+      chunk_size = functional_ops._get_chunk_size(chunk_size, n)
+      if chunk_size == 1:
+        maximum_iterations = n
+        loop_end = n
+      else:
+        maximum_iterations = n // chunk_size
+        loop_end = maximum_iterations * chunk_size
+
+      def compute(i, tas):
+        """The loop body of map_fn.
+
+        Args:
+          i: the loop counter
+          tas: the flat TensorArray accumulator list
+
+        Returns:
+          (i + chunk_size, tas): the updated counter + updated TensorArrays
+
+        Raises:
+          TypeError: if dtype and packed_fn_values structure do not match
+          ValueType: if dtype and packed_fn_values lengths do not match
+        """
+        indices = functional_ops._chunk_indices(i, chunk_size)
+        elems_chunk = functional_ops._read_chunk(elems_ta, indices, chunk_size)
+        outputs_flat = [step(elems_j) for elems_j in elems_chunk]
+        tas = functional_ops._write_chunk(tas, indices, outputs_flat)
+        return (i + chunk_size, tas)
+
+      _, r_a = control_flow_ops.while_loop(
+          lambda i, _: i < loop_end, compute, (i, accs_ta),
+          parallel_iterations=parallel_iterations,
+          back_prop=back_prop,
+          swap_memory=swap_memory and back_prop,
+          maximum_iterations=maximum_iterations)
+
+      if chunk_size > 1:
+        for index in range(loop_end, n):
+          elems_index = functional_ops._read_chunk(elems_ta, index, 1)[0]
+          r_a = functional_ops._write_chunk(r_a, index, [step(elems_index)])
+
+      results_flat = [r.stack() for r in r_a]
+      if profile_iterations:
+        results_flat = profiler.report_after(results_flat)
+
+    # pylint: enable=protected-access
 
     n_static = tensor_shape.Dimension(tensor_shape.dimension_value(
         elems_flat[0].get_shape().with_rank_at_least(1)[0]))
@@ -304,7 +851,11 @@ def map_fn_v2(fn,
               back_prop=True,
               swap_memory=False,
               infer_shape=True,
-              name=None):
+              name=None,
+              use_vectorized_map=False,
+              input_signature=None,
+              profile_iterations=False,
+              unroll="auto"):
   """map on the list of tensors unpacked from `elems` on dimension 0.
 
   The simplest version of `map_fn` repeatedly applies the callable `fn` to a
@@ -376,13 +927,48 @@ def map_fn_v2(fn,
       of Tensors differing from the structure of `elems`, then `dtype` is not
       optional and must have the same structure as the output of `fn`.
     parallel_iterations: (optional) The number of iterations allowed to run in
-      parallel. When graph building, the default value is 10. While executing
-      eagerly, the default value is set to 1.
+      parallel. When graph building, the default value is chosen from the type
+      of the device the loop is placed on. While executing eagerly, the default
+      value is set to 1.
     back_prop: (optional) Deprecated. False disables support for back
       propagation. Prefer using `tf.stop_gradient` instead.
-    swap_memory: (optional) True enables GPU-CPU memory swapping.
+    swap_memory: (optional) True enables GPU-CPU memory swapping.  Only
+      tensors kept for back propagation are swapped, so this has no effect if
+      `back_prop` is False.
     infer_shape: (optional) False disables tests for consistent output shapes.
     name: (optional) Name prefix for the returned tensors.
+    use_vectorized_map: (optional) True attempts to vectorize `fn` across the
+      first dimension of `elems` with `tf.vectorized_map`, replacing the loop
+      with batched ops.  If some op in `fn` cannot be vectorized, a warning is
+      logged and the regular `while_loop` based implementation is used.  The
+      results are checked against `dtype` and `elems` against
+      `input_signature`, and `unroll` must not be set.  When graph building,
+      if `elems` is a single tensor and `fn` is built only from elementwise
+      ops (such as `tf.add`, `tf.exp` or `tf.nn.relu`) on its argument and
+      scalar constants, `fn` is applied to all of `elems` at once instead.
+      `fn` is traced twice more on placeholders to make this check.
+    input_signature: (optional) A `tf.TensorSpec`, or a (possibly nested)
+      structure of them matching `elems`, describing the argument of `fn`.
+      When graph building with `back_prop` False, `fn` is traced once into a
+      function specialized to this signature.  If `fn` is a Python function
+      without a closure taking and returning a single tensor, later calls
+      with the same `fn` in the same graph reuse that function instead of
+      calling `fn` again, so they do not see changes to Python state that
+      `fn` reads.
+    profile_iterations: (optional) True times each call to `fn` in the loop
+      and logs the mean time per call when the loop finishes, with a hint on
+      whether launch overhead or computation dominates.  This always builds a
+      `while_loop`, and the timers add overhead of their own.
+    unroll: (optional) Whether to apply `fn` to the slices of `elems` in a
+      straight-line graph instead of a `while_loop`, which avoids the
+      overhead of each loop iteration but grows the graph, and its gradient,
+      with the number of elements.  True unrolls whenever the size of `elems`
+      is known statically and False never unrolls.  The default "auto"
+      unrolls up to 16 elements, or up to 64 on GPU when `back_prop` is False,
+      if `fn` creates no variables and no stateful ops, which `fn` is traced
+      once more to check.  Unrolled calls to `fn` each create their own
+      stateful ops, so that for example a seeded random op in `fn` gives the
+      same values for all the elements.
 
   Returns:
     A tensor or (possibly nested) sequence of tensors.  Each tensor packs the
@@ -392,7 +978,9 @@ def map_fn_v2(fn,
   Raises:
     TypeError: if `fn` is not callable or the structure of the output of
       `fn` and `dtype` do not match, or if elems is a SparseTensor.
-    ValueError: if the lengths of the output of `fn` and `dtype` do not match.
+    ValueError: if the lengths of the output of `fn` and `dtype` do not match,
+      if `input_signature` does not match `elems`, or if `unroll` is not
+      True, False or "auto" or is set together with `use_vectorized_map`.
 
   Examples:
     ```python
@@ -422,4 +1010,8 @@ def map_fn_v2(fn,
       back_prop=back_prop,
       swap_memory=swap_memory,
       infer_shape=infer_shape,
-      name=name)
+      name=name,
+      use_vectorized_map=use_vectorized_map,
+      input_signature=input_signature,
+      profile_iterations=profile_iterations,
+      unroll=unroll)